@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/angle_dist.py [--repeat N]`
+
+"""
+angle_dist.py
+Microbenchmark for the angle/distance conversion
+
+Reports the per-point cost of converting polylines of various lengths into (heading, distance) moves,
+one pair at a time with `angle_dist` versus all at once with `polyline_moves`,
+as well as the per-point cost of formatting the resulting moves as Scheme code.
+"""
+
+import os
+import sys
+import timeit
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+def per_point(stmt, num_points, repeat):
+    """Returns the best time per point (in nanoseconds) of calling STMT."""
+    number = max(1, 200000 // num_points)
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / (number * num_points) * 1e9
+
+class NullEmitter(svgparse.SchemeEmitter):
+    """A SchemeEmitter which formats its commands, but doesn't write them anywhere."""
+
+    def __init__(self):
+        svgparse.SchemeEmitter.__init__(self, os.devnull, 1 << 16)
+
+    def flush(self):
+        self.chunks, self.size = [], 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    emitter = NullEmitter()
+    print('%10s %16s %16s %10s %16s' % ('points', 'angle_dist (ns)', 'batched (ns)', 'speedup', 'scheme fmt (ns)'))
+    for num_points in (2, 5, 20, 100, 1000, 10000):
+        pts = np.cumsum(rng.normal(size=(num_points, 2)), axis=0)
+        pts_list = pts.tolist()
+
+        def _scalar():
+            return [svgparse.angle_dist(P0, P1) for P0, P1 in zip(pts_list[:-1], pts_list[1:])]
+
+        def _batched():
+            return svgparse.polyline_moves(pts)
+
+        angles, distances = svgparse.polyline_moves(pts)
+
+        def _format():
+            emitter.write_moves(angles, distances)
+
+        scalar, batched = per_point(_scalar, num_points, args.repeat), per_point(_batched, num_points, args.repeat)
+        print('%10d %16.1f %16.1f %9.1fx %16.1f' % (num_points, scalar, batched, scalar / batched,
+                                                    per_point(_format, num_points, args.repeat)))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/canvas.py <svg files>`
+
+"""
+canvas.py
+Compares the two ways of drawing in a Tk window
+
+For every input file, times drawing (without animation, up to and including the final screen update)
+- by moving the turtle along every polyline (`bulk_canvas = False`), and
+- by creating one canvas item per polyline (`bulk_canvas = True`),
+and reports the number of canvas items each one leaves behind.
+
+Needs a display. The path cache is disabled so that both sides include parsing.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+def time_draw(infile, turtle, screen, bulk):
+    """Returns (seconds, number of canvas items) for drawing INFILE with BULK_CANVAS set to BULK."""
+    turtle.reset()
+    screen.getcanvas().delete(svgparse.CanvasRenderer.TAG)
+    svgparse.bulk_canvas = bulk
+    config = svgparse.Config()
+    ctx = svgparse.Context(infile, 'turtle', *svgparse.window_size(config, screen), turtle=turtle, config=config)
+    start = time.time()
+    svgparse.draw(ctx)
+    return time.time() - start, len(screen.getcanvas().find_all())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+
+    svgparse.CACHE_DIR = None
+    svgparse.animation = False
+    try:
+        import turtle
+        turtle.mode('logo')
+        screen = turtle.getscreen()
+    except Exception as e:
+        sys.exit('[-] Cannot open a turtle window (%s: %s).' % (type(e).__name__, e))
+
+    stdout = sys.stdout
+    totals = [0.0, 0.0]
+    print('%-24s %10s %10s %10s %10s %10s' % ('file', 'turtle', 'items', 'bulk', 'items', 'speedup'))
+    for infile in args.input_files:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            turtle_time, turtle_items = time_draw(infile, turtle, screen, False)
+            bulk_time, bulk_items = time_draw(infile, turtle, screen, True)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        totals[0] += turtle_time
+        totals[1] += bulk_time
+        print('%-24s %10.3f %10d %10.3f %10d %9.1fx' % (os.path.basename(infile), turtle_time, turtle_items,
+                                                       bulk_time, bulk_items, turtle_time / bulk_time))
+    print('---')
+    print('%-24s %10.3f %10s %10.3f %10s %9.1fx' % ('TOTAL', totals[0], '', totals[1], '', totals[0] / totals[1]))
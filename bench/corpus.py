@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/corpus.py [--output FILE] [--compare FILE] [--threshold F] [--repeat N] [--raster] [--profile DIR] [<svg files>]`
+
+"""
+corpus.py
+Benchmarks every stage of a conversion over the bundled in/ corpus (or the given SVG files)
+
+For every input file, in a fresh process each time:
+- the stages of PATH_POLYLINE and TURTLE_TRAVERSE are run one after another over all of the file's paths
+  (reading the `d` attributes, tokenizing, flattening, clipping, simplifying if SIMPLIFY_TOLERANCE is set,
+  converting to headings/distances, and formatting the Scheme code), and each is timed on its own;
+- the whole `--scheme` conversion (and, with --raster, the `--raster` one) is timed end to end,
+  along with the peak resident memory of the process doing it.
+
+Also recorded are the numbers of paths, segments and points (before and after clipping),
+and the number of Scheme commands (lines) written.
+
+The results are saved as JSON (--output). Given the results of an earlier run (--compare), every stage
+that has become more than --threshold slower (and by more than --min-seconds) is flagged,
+and the script exits with status 1. With --profile, each file's stages are also run once more under cProfile,
+and the statistics saved in the given folder (to be read with `python -m pstats`).
+The path cache is disabled throughout.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import collections
+import multiprocessing
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+STAGES = ('read', 'tokenize', 'flatten', 'clip', 'simplify', 'moves', 'emit')
+RESULTS_VERSION = 1
+
+class CountingEmitter(svgparse.SchemeEmitter):
+    """A SchemeEmitter which formats its commands and counts their lines, but doesn't write them anywhere."""
+
+    def __init__(self):
+        svgparse.SchemeEmitter.__init__(self, os.devnull, 1 << 16)
+        self.lines = 0
+
+    def flush(self):
+        self.lines += sum(chunk.count('\n') for chunk in self.chunks)
+        self.chunks, self.size = [], 0
+
+def peak_rss_mb():
+    """Returns the peak resident memory of this process so far, in megabytes (or None where it is unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 ** (2 if sys.platform == 'darwin' else 1)  # bytes on macOS, kilobytes elsewhere
+
+def run_stages(infile, profile_dir=None):
+    """Runs the stages of a Scheme conversion of INFILE one after another.
+    Returns (times, counts): the seconds spent in each stage, and the sizes of what they produced.
+    If PROFILE_DIR is given, the stages are profiled (which slows them down) and the statistics saved there.
+    """
+    config = svgparse.Config()
+    ctx = svgparse.Context(infile, 'scheme', *svgparse.window_size(config), config=config)
+    times, counts = collections.OrderedDict(), collections.OrderedDict()
+    profiler = None
+    if profile_dir is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def _stage(name, func, items):
+        start = time.time()
+        results = [func(item) for item in items]
+        times[name] = time.time() - start
+        return results
+
+    paths = [d for d in _stage('read', lambda record: record[2], svgparse.iter_paths(infile)) if d is not None]
+    segments = _stage('tokenize', lambda d: svgparse.path_segments(ctx, d), paths)
+    polylines = _stage('flatten', lambda segs: svgparse.flatten_segments(*segs, config=ctx.config), segments)
+    counts['paths'] = len(paths)
+    counts['segments'] = sum(len(segs[0]) for segs in segments)
+    counts['points'] = sum(len(pts) for pts, _ in polylines)
+    if ctx.config.clip:
+        polylines = _stage('clip', lambda polyline: svgparse.clip_polyline(polyline[0], polyline[1], ctx.bounds), polylines)
+    if ctx.config.simplify_tolerance is not None:
+        polylines = _stage('simplify', lambda polyline: svgparse.simplify_polyline(
+            polyline[0], polyline[1], ctx.config.simplify_tolerance), polylines)
+    counts['points_drawn'] = sum(len(pts) for pts, _ in polylines)
+
+    subpaths = [pts[offsets[i]:offsets[i + 1]] for pts, offsets in polylines for i in range(len(offsets) - 1)]
+
+    def _moves(pts):
+        """As in TURTLE_TRAVERSE: the moves along PTS, and where the heading changes."""
+        angles, distances = svgparse.polyline_moves(pts)
+        headings = np.round(angles, ctx.config.SCHEME_PRECISION)
+        turns = np.ones(len(headings), dtype=bool)
+        turns[1:] = headings[1:] != headings[:-1]
+        return pts[0], angles, distances, turns
+
+    moves = _stage('moves', _moves, [pts for pts in subpaths if len(pts) >= 2])
+    emitter = CountingEmitter()
+
+    def _emit(move):
+        start, angles, distances, turns = move
+        emitter.write('(penup) (setposition %f %f) (pendown)\n' % tuple(start.tolist()))
+        emitter.write_moves(angles, distances, turns)
+
+    _stage('emit', _emit, moves)
+    emitter.flush()
+    counts['commands'] = emitter.lines
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(profile_dir, os.path.basename(infile) + '.prof'))
+    return times, counts
+
+def run_conversion(infile, backend):
+    """Converts INFILE end to end with BACKEND. Returns (seconds, peak memory in MB, lines written)."""
+    _, outfile, seconds, _, _, error = svgparse.convert_file(infile, backend)
+    if error is not None:
+        raise RuntimeError('could not convert %s (%s)' % (infile, error))
+    lines = None
+    if backend == 'scheme':
+        with open(outfile) as f:
+            lines = sum(1 for _ in f)
+    os.remove(outfile)
+    return seconds, peak_rss_mb(), lines
+
+def run_task(task):
+    """Runs a single TASK (a function and its arguments) in a worker process, with its output silenced."""
+    func, args = task
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        return func(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def bench_file(pool, infile, args):
+    """Returns the results for INFILE, each measurement taken in a fresh worker process (the best of ARGS.REPEAT)."""
+    runs = [pool.apply(run_task, [(run_stages, (infile,))]) for _ in range(args.repeat)]
+    times = collections.OrderedDict((stage, min(t[stage] for t, _ in runs)) for stage in runs[0][0])
+    if args.profile is not None:
+        pool.apply(run_task, [(run_stages, (infile, args.profile))])
+    result = collections.OrderedDict([('stages', times), ('counts', runs[0][1])])
+    for backend in ('scheme', 'raster') if args.raster else ('scheme',):
+        runs = [pool.apply(run_task, [(run_conversion, (infile, backend))]) for _ in range(args.repeat)]
+        seconds, peak_mb, lines = min(runs)
+        result[backend] = seconds
+        result['%s_peak_mb' % backend] = peak_mb
+        if lines is not None:
+            result['counts']['scheme_lines'] = lines
+    return result
+
+def totals(files):
+    """Sums the stage and conversion times of all FILES."""
+    total = collections.OrderedDict((stage, 0.0) for stage in STAGES)
+    for result in files.values():
+        for stage, seconds in result['stages'].items():
+            total[stage] += seconds
+        for backend in ('scheme', 'raster'):
+            if backend in result:
+                total[backend] = total.get(backend, 0.0) + result[backend]
+    return collections.OrderedDict((key, value) for key, value in total.items() if value > 0)
+
+def compare(old, new, threshold, min_seconds):
+    """Prints how the timings in NEW compare with those in OLD. Returns the list of regressions found."""
+    regressions = []
+
+    def _check(label, old_time, new_time):
+        change = new_time / old_time - 1 if old_time > 0 else float('inf')
+        regressed = change > threshold and new_time - old_time > min_seconds
+        if regressed:
+            regressions.append('%s: %.3fs -> %.3fs (%+.0f%%)' % (label, old_time, new_time, 100 * change))
+        return change, regressed
+
+    common = [name for name in new['files'] if name in old['files']]
+    old_totals = totals(collections.OrderedDict((name, old['files'][name]) for name in common))
+    new_totals = totals(collections.OrderedDict((name, new['files'][name]) for name in common))
+    print('')
+    print('[+] Compared with %s over the %d file(s) in both runs:' % (old['created'], len(common)))
+    print('%-12s %10s %10s %9s' % ('stage', 'before', 'after', 'change'))
+    for stage, new_time in new_totals.items():
+        if stage not in old_totals:
+            continue
+        change, regressed = _check('TOTAL ' + stage, old_totals[stage], new_time)
+        print('%-12s %10.3f %10.3f %+8.1f%%%s' % (stage, old_totals[stage], new_time, 100 * change,
+                                                  '  <-- REGRESSION' if regressed else ''))
+
+    for name, result in new['files'].items():
+        old_result = old['files'].get(name)
+        if old_result is None:
+            continue
+        for stage, new_time in list(result['stages'].items()) + [(b, result[b]) for b in ('scheme', 'raster') if b in result]:
+            old_time = old_result['stages'].get(stage, old_result.get(stage))
+            if old_time is not None:
+                _check('%s %s' % (name, stage), old_time, new_time)
+        changed = ['%s %d -> %d' % (key, old_result['counts'][key], count) for key, count in result['counts'].items()
+                   if key in old_result['counts'] and old_result['counts'][key] != count]
+        if changed:
+            print('[*] %s: output changed (%s)' % (name, ', '.join(changed)))
+
+    if regressions:
+        print('---')
+        print('[-] %d regression(s) beyond %.0f%%:' % (len(regressions), 100 * threshold))
+        for regression in regressions:
+            print('    ' + regression)
+    else:
+        print('[+] No regressions beyond %.0f%%.' % (100 * threshold))
+    return regressions
+
+if __name__ == '__main__':
+    repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', '-o', type=str, default='bench_results.json', help='where to save the results')
+    parser.add_argument('--compare', '-c', type=str, default=None, help='the results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.10, help='the slowdown to flag (0.10 = 10%%)')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='ignore slowdowns smaller than this')
+    parser.add_argument('--repeat', type=int, default=1, help='keep the best of this many runs')
+    parser.add_argument('--raster', action='store_true', help='also time --raster conversions')
+    parser.add_argument('--profile', type=str, default=None, help='save cProfile statistics in this folder')
+    parser.add_argument('input_files', type=str, nargs='*', help='___.svg (default: in/*.svg)')
+    args = parser.parse_args()
+
+    svgparse.CACHE_DIR = None
+    infiles = [os.path.abspath(f) for f in args.input_files or sorted(glob.glob(os.path.join(repo, 'in', '*.svg')))]
+    output = os.path.abspath(args.output)
+    if args.profile is not None:
+        args.profile = os.path.abspath(args.profile)
+        if not os.path.isdir(args.profile):
+            os.makedirs(args.profile)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs(svgparse.OUTFOLDER)
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+
+    files = collections.OrderedDict()
+    config = svgparse.Config()
+    columns = [stage for stage in STAGES if stage != 'clip' or config.clip]
+    columns = [stage for stage in columns if stage != 'simplify' or config.simplify_tolerance is not None]
+    backends = ('scheme', 'raster') if args.raster else ('scheme',)
+    print('%-16s %9s %9s ' % ('file', 'points', 'commands') + ' '.join('%9s' % c for c in columns + list(backends))
+          + ' %9s' % 'peak MB')
+    try:
+        for infile in infiles:
+            name = os.path.basename(infile)
+            result = files[name] = bench_file(pool, infile, args)
+            print('%-16s %9d %9d ' % (name[:16], result['counts']['points_drawn'], result['counts']['scheme_lines'])
+                  + ' '.join('%9.3f' % result['stages'].get(c, result.get(c, 0.0)) for c in columns + list(backends))
+                  + ' %9s' % ('-' if result['scheme_peak_mb'] is None else '%.0f' % result['scheme_peak_mb']))
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(workdir)
+
+    results = collections.OrderedDict([
+        ('version', RESULTS_VERSION),
+        ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('params', collections.OrderedDict((name, getattr(svgparse, name)) for name in (
+            'step_size', 'flatten_tolerance', 'bezier_option', 'cubic_unfinished', 'standard_paths', 'clip',
+            'intersperse', 'color_batch', 'simplify_tolerance', 'reorder_paths'))),
+        ('files', files),
+        ('totals', totals(files)),
+    ])
+    print('---')
+    print('%-16s %9s %9s ' % ('TOTAL', '', '') + ' '.join('%9.3f' % results['totals'].get(c, 0.0)
+                                                          for c in columns + list(backends)))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('[+] Saved results to %s.' % output)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, results, args.threshold, args.min_seconds):
+            sys.exit(1)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/flattening.py [--step STEP] [--tolerance TOL ...] <svg files>`
+
+"""
+flattening.py
+Compares fixed-step Bézier sampling against adaptive flattening
+
+For every curve segment in the input files (in turtle coordinates, i.e. pixels), reports the number of points
+generated and the maximum deviation between the true curve and the resulting chords, for
+- the fixed sampler (every STEP in t, as with `step_size`), and
+- the adaptive sampler (`flatten_tolerance`), for each TOL given.
+
+Both samplers include the endpoint of each curve here, so that only the flattening itself is measured.
+The deviation is measured at DENSE evenly spaced values of t per segment, against the chord spanning each value.
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+DENSE = 64
+CHUNK = 10000
+
+def evaluate(ctrl_pts, t):
+    """Evaluates the segments CTRL_PTS (N x R x 2) at the parameters T (N x M). Returns an N x M x 2 array."""
+    s = 1 - t
+    if ctrl_pts.shape[1] == 3:
+        basis = np.stack([s * s, 2 * s * t, t * t], axis=-1)
+    else:
+        basis = np.stack([s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t], axis=-1)
+    return np.einsum('nmr,nrd->nmd', basis, ctrl_pts)
+
+def max_deviation(ctrl_pts, num_steps):
+    """Returns the largest distance between any segment and its chords, when sampled in NUM_STEPS equal steps."""
+    worst = 0.0
+    for i in range(0, len(ctrl_pts), CHUNK):
+        ctrl, k = ctrl_pts[i:i + CHUNK], num_steps[i:i + CHUNK].astype(float)[:, None]
+        t = np.tile(np.linspace(0, 1, DENSE), (len(ctrl), 1))
+        j = np.minimum(np.floor(t * k), k - 1)
+        p, a, b = evaluate(ctrl, t), evaluate(ctrl, j / k), evaluate(ctrl, (j + 1) / k)
+        ab, ap = b - a, p - a
+        ab_sq = (ab * ab).sum(axis=-1)
+        u = np.clip((ap * ab).sum(axis=-1) / np.where(ab_sq > 0, ab_sq, 1), 0, 1)
+        offset = ap - ab * u[..., None]
+        worst = max(worst, np.hypot(offset[..., 0], offset[..., 1]).max())
+    return worst
+
+def curve_segments(infile):
+    """Returns all curve segments in INFILE as an N x NUM_REQ_PTS x 2 array of turtle coordinates."""
+    config = svgparse.Config()
+    ctx = svgparse.Context(infile, 'scheme', *svgparse.window_size(config), config=config)
+    segments = []
+    for _, _, d in svgparse.iter_paths(infile):
+        if d is None:
+            continue
+        ctrl_svg, is_line, _, _ = svgparse.tokenize_path(d, ctx.config)
+        ctrl_svg = ctrl_svg[~is_line]
+        segments.append(np.stack(ctx.svg_to_turtle(ctrl_svg[..., 0], ctrl_svg[..., 1]), axis=-1))
+    return np.concatenate(segments) if segments else np.zeros((0, svgparse.bezier_num_pts(ctx.config.bezier_option), 2))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--step', type=float, default=svgparse.step_size, help='step size of the fixed sampler')
+    parser.add_argument('--tolerance', type=float, action='append', help='tolerance(s) of the adaptive sampler')
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+    tolerances = args.tolerance or [0.1, 0.25, 0.5, 1.0]
+
+    print('%-20s %-18s %10s %12s %14s' % ('file', 'sampler', 'segments', 'points', 'max deviation'))
+    for infile in args.input_files:
+        ctrl_pts = curve_segments(infile)
+        name = os.path.basename(infile)
+        fixed_steps = np.full(len(ctrl_pts), len(np.arange(0, 1, args.step)))
+        print('%-20s %-18s %10d %12d %14.4f' % (name, 'fixed %g' % args.step, len(ctrl_pts),
+                                               (fixed_steps + 1).sum(), max_deviation(ctrl_pts, fixed_steps)))
+        for tolerance in tolerances:
+            steps = svgparse.bezier_subdivisions(ctrl_pts, tolerance)
+            print('%-20s %-18s %10d %12d %14.4f' % (name, 'adaptive %g' % tolerance, len(ctrl_pts),
+                                                   (steps + 1).sum(), max_deviation(ctrl_pts, steps)))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/raster.py [--no-tk] <svg files>`
+
+"""
+raster.py
+Compares the two ways of producing a PNG
+
+For every input file, times
+- the NumPy rasterizer (`svgparse.py --raster`), and
+- the turtle path: drawing on a Tk canvas, then exporting it with canvasvg and CairoSVG (`save_output = True`).
+
+The turtle path needs a display (plus canvasvg and CairoSVG); if any of these are missing, it is skipped.
+The path cache is disabled so that both sides include parsing.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+def time_raster(infile):
+    config = svgparse.Config()
+    ctx = svgparse.Context(infile, 'raster', *svgparse.window_size(config), config=config)
+    start = time.time()
+    svgparse.draw(ctx)
+    return time.time() - start
+
+def time_tk(infile, turtle, screen):
+    turtle.reset()
+    screen.getcanvas().delete(svgparse.CanvasRenderer.TAG)
+    config = svgparse.Config()
+    ctx = svgparse.Context(infile, 'turtle', *svgparse.window_size(config, screen), turtle=turtle, config=config)
+    start = time.time()
+    svgparse.draw(ctx)
+    svgparse.save_canvas(ctx)
+    return time.time() - start
+
+def setup_tk():
+    """Returns the (turtle module, screen), or None if the turtle path can't be run here."""
+    try:
+        import canvasvg
+        import cairosvg
+        import turtle
+        turtle.mode('logo')
+        return turtle, turtle.getscreen()
+    except Exception as e:
+        print('[-] Skipping the turtle path (%s: %s).' % (type(e).__name__, e))
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--no-tk', action='store_true', help='only time the rasterizer')
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+
+    svgparse.CACHE_DIR = None
+    infiles = [os.path.abspath(infile) for infile in args.input_files]
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs(svgparse.OUTFOLDER)
+    tk = None if args.no_tk else setup_tk()
+
+    stdout = sys.stdout
+    totals = [0.0, 0.0]
+    print('%-24s %10s %10s %10s' % ('file', 'raster', 'tk', 'speedup'))
+    for infile in infiles:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            raster_time = time_raster(infile)
+            tk_time = time_tk(infile, *tk) if tk else None
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        totals[0] += raster_time
+        if tk_time is None:
+            print('%-24s %10.3f %10s %10s' % (os.path.basename(infile), raster_time, '-', '-'))
+        else:
+            totals[1] += tk_time
+            print('%-24s %10.3f %10.3f %9.1fx' % (os.path.basename(infile), raster_time, tk_time, tk_time / raster_time))
+    print('---')
+    if tk:
+        print('%-24s %10.3f %10.3f %9.1fx' % ('TOTAL', totals[0], totals[1], totals[1] / totals[0]))
+    else:
+        print('%-24s %10.3f %10s %10s' % ('TOTAL', totals[0], '-', '-'))
+    shutil.rmtree(workdir)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/scheme_compact.py [--precision P ...] <svg files>`
+
+"""
+scheme_compact.py
+Compares the unrolled and compact (SCHEME_COMPACT) forms of the Scheme output
+
+For every input file, converts it with `--scheme` in both forms (the compact one at each given SCHEME_PRECISION),
+and reports the size of each file and the time taken to interpret it.
+
+There is no 61A Scheme interpreter to hand, so the files are run by the small interpreter below instead.
+Like the 61A one, it is written in Python: it tokenizes the file one character at a time, reads the tokens
+into pairs, and evaluates them with tail calls (with turtle commands only tracking where the turtle goes).
+Reading and evaluation are timed separately; the timings are meant for comparing the two forms,
+not as absolute numbers. It also checks that the compact form draws the same lines,
+reporting how far apart their endpoints are.
+"""
+
+import os
+import sys
+import math
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+DELIMITERS = set("()'")
+WHITESPACE = set(' \t\n')
+
+class Pair(object):
+    def __init__(self, first, rest):
+        self.first, self.rest = first, rest
+
+class Procedure(object):
+    def __init__(self, params, body, env):
+        self.params, self.body, self.env = params, body, env
+
+class Turtle(object):
+    """Keeps track of the lines drawn by the turtle commands."""
+
+    def __init__(self):
+        self.x, self.y, self.heading, self.down, self.lines = 0.0, 0.0, 0.0, True, []
+
+    def move_to(self, x, y):
+        if self.down:
+            self.lines.append((self.x, self.y, x, y))
+        self.x, self.y = x, y
+
+    def forward(self, distance):
+        angle = math.radians(self.heading)
+        self.move_to(self.x + distance * math.sin(angle), self.y + distance * math.cos(angle))
+
+    def setheading(self, heading):
+        self.heading = heading
+
+    def setposition(self, x, y):
+        self.move_to(x, y)
+
+    def penup(self):
+        self.down = False
+
+    def pendown(self):
+        self.down = True
+
+def tokenize(text):
+    """Splits TEXT into tokens, one character at a time."""
+    tokens, token = [], []
+    for char in text:
+        if char in DELIMITERS or char in WHITESPACE:
+            if token:
+                tokens.append(''.join(token))
+                token = []
+            if char in DELIMITERS:
+                tokens.append(char)
+        else:
+            token.append(char)
+    if token:
+        tokens.append(''.join(token))
+    return tokens
+
+def read(tokens):
+    """Reads every expression in TOKENS (consumed from the end, like a stack) into nested PAIRs."""
+    def _read():
+        token = tokens.pop()
+        if token == "'":
+            return Pair('quote', Pair(_read(), None))
+        if token == '(':
+            items = []
+            while tokens[-1] != ')':
+                items.append(_read())
+            tokens.pop()
+            result = None
+            for item in reversed(items):
+                result = Pair(item, result)
+            return result
+        try:
+            return float(token)
+        except ValueError:
+            return token
+
+    exprs = []
+    while tokens:
+        exprs.append(_read())
+    return exprs
+
+def make_globals(turtle):
+    def _ignore(*args):
+        return None
+    env = {'nil': None, 'car': lambda pair: pair.first, 'cdr': lambda pair: pair.rest,
+           'null?': lambda value: value is None, 'not': lambda value: value is False}
+    for name in ('setheading', 'forward', 'setposition', 'penup', 'pendown'):
+        env[name] = getattr(turtle, name)
+    for name in ('speed', 'color', 'pensize', 'begin_fill', 'end_fill', 'hideturtle'):
+        env[name] = _ignore
+    return [env]
+
+def lookup(name, env):
+    for frame in reversed(env):
+        if name in frame:
+            return frame[name]
+    raise NameError(name)
+
+def evaluate(expr, env):
+    """Evaluates EXPR in ENV (a list of frames), looping rather than recursing on tail calls."""
+    while True:
+        if isinstance(expr, float) or expr is None:
+            return expr
+        if not isinstance(expr, Pair):
+            return expr if expr.startswith('"') else lookup(expr, env)
+        first, rest = expr.first, expr.rest
+        if first == 'quote':
+            return rest.first
+        if first == 'define':
+            signature, body = rest.first, rest.rest
+            params = []
+            param = signature.rest
+            while param is not None:
+                params.append(param.first)
+                param = param.rest
+            env[-1][signature.first] = Procedure(params, body, env)
+            return signature.first
+        if first == 'if':
+            if evaluate(rest.first, env) is not False:
+                expr = rest.rest.first
+            elif rest.rest.rest is not None:
+                expr = rest.rest.rest.first
+            else:
+                return None
+            continue
+        if first == 'begin':
+            while rest.rest is not None:
+                evaluate(rest.first, env)
+                rest = rest.rest
+            expr = rest.first
+            continue
+        proc = evaluate(first, env)
+        args = []
+        while rest is not None:
+            args.append(evaluate(rest.first, env))
+            rest = rest.rest
+        if not isinstance(proc, Procedure):
+            return proc(*args)
+        env = proc.env + [dict(zip(proc.params, args))]
+        body = proc.body
+        while body.rest is not None:
+            evaluate(body.first, env)
+            body = body.rest
+        expr = body.first
+
+def interpret(path):
+    """Runs the Scheme file at PATH. Returns (seconds spent reading, seconds spent evaluating, lines drawn)."""
+    start = time.time()
+    with open(path) as f:
+        tokens = tokenize(f.read())
+    tokens.reverse()
+    exprs = read(tokens)
+    read_time = time.time() - start
+    turtle = Turtle()
+    env = make_globals(turtle)
+    for expr in exprs:
+        evaluate(expr, env)
+    return read_time, time.time() - start - read_time, turtle.lines
+
+def convert(infile, compact, precision):
+    """Converts INFILE to Scheme code in the given form. Returns the path of the result (under a unique name)."""
+    svgparse.SCHEME_COMPACT, svgparse.SCHEME_PRECISION = compact, precision
+    _, outfile, _, _, _, error = svgparse.convert_file(infile, 'scheme')
+    if error is not None:
+        raise RuntimeError('could not convert %s (%s)' % (infile, error))
+    renamed = '%s.%s%d' % (outfile, 'compact' if compact else 'unrolled', precision)
+    os.rename(outfile, renamed)
+    return renamed
+
+def max_deviation(lines, reference):
+    """Returns the largest distance between corresponding endpoints of LINES and REFERENCE (inf if they don't match up)."""
+    if len(lines) != len(reference):
+        return float('inf')
+    return max([max(abs(a - b) for a, b in zip(line, ref)) for line, ref in zip(lines, reference)] or [0.0])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--precision', type=int, nargs='+', default=[6, 2], help='SCHEME_PRECISION for the compact form')
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+
+    infiles = [os.path.abspath(infile) for infile in args.input_files]
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs(svgparse.OUTFOLDER)
+    forms = [(False, 6)] + [(True, precision) for precision in args.precision]
+    labels = ['unrolled'] + ['compact %d' % precision for precision in args.precision]
+
+    stdout = sys.stdout
+    totals = [[0, 0.0, 0.0] for _ in forms]
+    header = '%-16s %-11s %10s %7s %10s %10s %7s %10s'
+    row = '%-16s %-11s %10.1f %6.0f%% %10.3f %10.3f %6.0f%% %10s'
+    print(header % ('file', 'form', 'KB', 'size', 'read (s)', 'eval (s)', 'time', 'max err'))
+    for infile in infiles:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            outfiles = [convert(infile, compact, precision) for compact, precision in forms]
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        reference = None
+        for i, (label, outfile) in enumerate(zip(labels, outfiles)):
+            size = os.path.getsize(outfile)
+            read_time, eval_time, lines = interpret(outfile)
+            if reference is None:
+                reference, base = lines, (size, read_time + eval_time)
+            for j, value in enumerate((size, read_time, eval_time)):
+                totals[i][j] += value
+            print(row % (os.path.basename(infile)[:16] if i == 0 else '', label, size / 1024.0, 100.0 * size / base[0],
+                         read_time, eval_time, 100.0 * (read_time + eval_time) / max(base[1], 1e-9),
+                         '%.2g' % max_deviation(lines, reference)))
+            os.remove(outfile)
+    print('---')
+    for i, label in enumerate(labels):
+        size, read_time, eval_time = totals[i]
+        print(row % ('TOTAL' if i == 0 else '', label, size / 1024.0, 100.0 * size / totals[0][0], read_time, eval_time,
+                     100.0 * (read_time + eval_time) / max(totals[0][1] + totals[0][2], 1e-9), ''))
+    shutil.rmtree(workdir)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/scheme_emitter.py [--script <svgparse.py> ...] [--flush-size N ...] <svg files>`
+
+"""
+scheme_emitter.py
+Measures the cost of writing Scheme output
+
+Runs `svgparse.py --scheme` in-process on every input file and reports, per file,
+the wall time, the number of `open` calls, and the number of `write` syscalls (read from /proc/self/io, Linux only).
+
+Any number of versions of the script can be compared (e.g. one exported with `git show <rev>:svgparse.py`),
+as can several values of SCHEME_FLUSH_SIZE (each substituted into a temporary copy of the script).
+"""
+
+import os
+import re
+import sys
+import time
+import runpy
+import shutil
+import argparse
+import tempfile
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+def write_syscalls():
+    """Returns the number of write syscalls made by this process so far, or None if unavailable."""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('syscw:'):
+                    return int(line.split()[1])
+    except IOError:
+        return None
+
+def run_script(script, infile, workdir):
+    """Converts INFILE to Scheme using SCRIPT (with WORKDIR as the current directory).
+    Returns a (seconds, opens, writes) tuple.
+    """
+    num_opens = [0]
+    real_open = builtins.open
+
+    def _counting_open(*args, **kwargs):
+        num_opens[0] += 1
+        return real_open(*args, **kwargs)
+
+    prev_cwd, prev_argv, prev_stdout = os.getcwd(), sys.argv, sys.stdout
+    os.chdir(workdir)
+    sys.argv = [script, '--scheme', infile]
+    sys.stdout = open(os.devnull, 'w')
+    writes_before = write_syscalls()
+    builtins.open = _counting_open
+    start = time.time()
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:  # the script exits with the number of files it failed to convert
+        if e.code:
+            raise RuntimeError('%s failed to convert %s (exit status %r)' % (script, infile, e.code))
+    finally:
+        elapsed = time.time() - start
+        builtins.open = real_open
+        writes_after = write_syscalls()
+        sys.stdout.close()
+        os.chdir(prev_cwd)
+        sys.argv, sys.stdout = prev_argv, prev_stdout
+    writes = None if writes_before is None else writes_after - writes_before
+    return elapsed, num_opens[0], writes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--script', action='append', help='version(s) of svgparse.py to run (default: svgparse.py)')
+    parser.add_argument('--flush-size', type=int, action='append', help='value(s) of SCHEME_FLUSH_SIZE to try')
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    scripts = [os.path.abspath(s) for s in args.script or [os.path.join(here, os.pardir, 'svgparse.py')]]
+    workdir = tempfile.mkdtemp()
+
+    configs = []  # (label, script path)
+    for script in scripts:
+        if not args.flush_size:
+            configs.append((os.path.basename(script), script))
+            continue
+        source = open(script).read()
+        for flush_size in args.flush_size:
+            variant = os.path.join(workdir, 'flush%d_%s' % (flush_size, os.path.basename(script)))
+            with open(variant, 'w') as f:
+                f.write(re.sub(r'^SCHEME_FLUSH_SIZE\s*=.*$', 'SCHEME_FLUSH_SIZE = %d' % flush_size, source, flags=re.M))
+            configs.append(('%s (flush %d)' % (os.path.basename(script), flush_size), variant))
+
+    totals = dict((label, [0.0, 0, 0]) for label, _ in configs)
+    print('%-24s %-32s %10s %10s %10s' % ('file', 'script', 'seconds', 'opens', 'writes'))
+    for infile in args.input_files:
+        for label, script in configs:
+            elapsed, opens, writes = run_script(script, os.path.abspath(infile), workdir)
+            print('%-24s %-32s %10.3f %10d %10s' % (os.path.basename(infile), label, elapsed, opens, writes))
+            totals[label][0] += elapsed
+            totals[label][1] += opens
+            totals[label][2] += writes or 0
+    print('---')
+    for label, _ in configs:
+        print('%-24s %-32s %10.3f %10d %10d' % ('TOTAL', label, totals[label][0], totals[label][1], totals[label][2]))
+    shutil.rmtree(workdir)
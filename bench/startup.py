@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/startup.py [--repeat N] [svg file (default: in/bezier.svg)]`
+
+"""
+startup.py
+Times how long a small conversion takes from a fresh process, and what it imports
+
+For a small input (where startup is most of the work), times fresh Python processes that
+- do nothing, import NumPy, or import svgparse (the baselines),
+- run `svgparse.py --scheme` and `--raster` as scripts, and
+- run the same with `python -m svgparse`, which reuses the compiled module instead of recompiling the script,
+reporting the median of --repeat runs of each. The output and cache folders are in a temporary directory,
+and each conversion is run once beforehand (with CACHE_DIR set), so that the timed runs all draw from the path cache.
+
+It also converts the file through the library API (svgparse.convert) in a fresh process per backend,
+and lists which of the heavy optional modules (Tk, turtle, canvasvg, CairoSVG, multiprocessing) got imported.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+SCRIPT = os.path.join(PACKAGE_DIR, 'svgparse.py')
+HEAVY_MODULES = ('tkinter', 'turtle', 'canvasvg', 'cairosvg', 'multiprocessing')
+
+IMPORTED_CHECK = '''
+import sys
+sys.path.insert(0, %r)
+import svgparse
+svgparse.convert(%r, backend=%r)
+print(' '.join(name for name in %r if name in sys.modules) or '-')
+'''
+
+def run(args):
+    """Runs Python with ARGS in a fresh process, returning its output (and failing loudly if it fails)."""
+    return subprocess.check_output([sys.executable] + args, stderr=subprocess.STDOUT, universal_newlines=True)
+
+def median_time(args, repeat):
+    """Returns the median wall time (in seconds) of REPEAT fresh processes running Python with ARGS."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        run(args)
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('input_file', type=str, nargs='?', default=os.path.join(PACKAGE_DIR, 'in', 'bezier.svg'))
+    args = parser.parse_args()
+
+    infile = os.path.abspath(args.input_file)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs('out')
+    with open('cache.txt', 'w') as f:
+        f.write("CACHE_DIR = 'cache'\n")
+    os.environ['PYTHONPATH'] = PACKAGE_DIR + os.pathsep + os.environ.get('PYTHONPATH', '')
+    os.environ.pop('PYTHONDONTWRITEBYTECODE', None)  # let the warm-up runs cache the compiled module, as they usually would
+
+    cases = [('python', ['-c', 'pass']),
+             ('import numpy', ['-c', 'import numpy']),
+             ('import svgparse', ['-c', 'import svgparse'])]
+    for backend in ('scheme', 'raster'):
+        cases.append(('svgparse.py --%s' % backend, [SCRIPT, '--%s' % backend, '--config', 'cache.txt', infile]))
+        cases.append(('-m svgparse --%s' % backend, ['-m', 'svgparse', '--%s' % backend, '--config', 'cache.txt', infile]))
+    for _, case_args in cases:
+        run(case_args)  # warm up the path cache, the bytecode cache and the file system
+
+    print('%-26s %10s' % ('process', 'time (ms)'))
+    for label, case_args in cases:
+        print('%-26s %10.1f' % (label, 1000 * median_time(case_args, args.repeat)))
+
+    print('---')
+    print('%-26s %s' % ('convert(backend=...)', 'heavy modules imported'))
+    for backend in ('scheme', 'raster', 'drawing'):
+        output = run(['-c', IMPORTED_CHECK % (PACKAGE_DIR, infile, backend, HEAVY_MODULES)])
+        print('%-26s %s' % (backend, output.strip().splitlines()[-1]))
+    shutil.rmtree(workdir)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/tokenizer.py [--repeat N] <svg files>`
+
+"""
+tokenizer.py
+Compares ways of reading path data
+
+For every input file, times reading all of its `d` attributes
+- the original way: `d.split()`, then stripping the `c` / `l` / `m` / `z` labels and calling `int` on every token,
+- with `tokenize_numbers` (commands and their arguments as arrays), and
+- with `tokenize_path` (the control points of every segment, ready for Bézier evaluation).
+
+The original way only understands whitespace-separated integers with relative `c` / `l` / `m` commands,
+so its column is left blank for files that it cannot read.
+"""
+
+import os
+import sys
+import timeit
+import functools
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+def split_and_int(d):
+    """Reads D as the original script did, returning the starting point and a list of (label, dx, dy) moves."""
+    tokens = d.split()
+    moves, label = [], None
+    for dx, dy in zip(*[iter(tokens[2:])] * 2):
+        if dx[0].isalpha():
+            label, dx = dx[0], dx[1:]
+        if dy[-1] == 'z':
+            dy = dy[:-1]
+        moves.append((label, int(dx), int(dy)))
+    return (int(tokens[0][1:]), int(tokens[1])), moves
+
+def best_time(func, paths, repeat):
+    """Returns the best time (in seconds) of calling FUNC on every path in PATHS, or None if it fails."""
+    try:
+        return min(timeit.repeat(lambda: [func(d) for d in paths], number=1, repeat=repeat))
+    except (ValueError, IndexError):
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+
+    funcs = (split_and_int, svgparse.tokenize_numbers, functools.partial(svgparse.tokenize_path, config=svgparse.Config()))
+    totals = [0.0] * len(funcs)
+    print('%-20s %8s %10s %12s %12s %12s' % ('file', 'paths', 'numbers', 'split (s)', 'numbers (s)', 'segments (s)'))
+    for infile in args.input_files:
+        paths = [d for _, _, d in svgparse.iter_paths(infile) if d is not None]
+        num_numbers = sum(args.size for d in paths for _, args in svgparse.tokenize_numbers(d))
+        times = [best_time(func, paths, args.repeat) for func in funcs]
+        print('%-20s %8d %10d %s' % (os.path.basename(infile)[:20], len(paths), num_numbers,
+                                    ' '.join('%12s' % ('-' if t is None else '%.3f' % t) for t in times)))
+        if times[0] is not None:
+            totals = [total + t for total, t in zip(totals, times)]
+    print('---')
+    print('%-20s %8s %10s %s' % ('TOTAL (readable)', '', '', ' '.join('%12.3f' % total for total in totals)))
+    print('%-20s %8s %10s %s' % ('per split', '', '', ' '.join('%11.2fx' % (total / totals[0]) for total in totals)))
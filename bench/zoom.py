@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## USAGE: `python bench/zoom.py [--fractions F ...] [--lod P] <svg files>`
+
+"""
+zoom.py
+Times zoomed-in renders against rendering the whole drawing
+
+For every input file, renders (with `--raster`) the whole viewBox, then a square in the middle of it
+covering each given fraction of its width and height (see ZOOM). The first zoom builds the bounding-box index
+and caches it, so it is timed separately ("index"); the later ones read it back from the cache.
+With --lod, every render also collapses paths smaller than that many pixels (see LOD_PIXELS).
+
+The drawing cache is bypassed (every render starts from the SVG), but the bounding-box index is not.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import svgparse
+
+def time_render(infile, zoom):
+    """Renders INFILE zoomed in on ZOOM (None for all of it). Returns (seconds, paths drawn, paths culled)."""
+    svgparse.zoom = zoom
+    config = svgparse.Config()
+    ctx = svgparse.Context(infile, 'raster', *svgparse.window_size(config), config=config)
+    start = time.time()
+    num_paths, _ = svgparse.draw(ctx)
+    return time.time() - start, num_paths, ctx.num_culled
+
+def central_square(infile, fraction):
+    """Returns the ZOOM rectangle covering FRACTION of the width and height of INFILE's viewBox, around its center."""
+    min_x, min_y, width, height = svgparse.view_box(svgparse.read_svg_attrib(infile))
+    return (min_x + width * (1 - fraction) / 2, min_y + height * (1 - fraction) / 2, width * fraction, height * fraction)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fractions', type=float, nargs='+', default=[0.5, 0.25, 0.1], help='size of each zoom')
+    parser.add_argument('--lod', type=float, default=None, help='LOD_PIXELS for every render')
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg')
+    args = parser.parse_args()
+
+    infiles = [os.path.abspath(infile) for infile in args.input_files]
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs(svgparse.OUTFOLDER)
+    svgparse.lod_pixels = args.lod
+    cache_dir = svgparse.CACHE_DIR = os.path.join(workdir, 'cache')
+    stdout = sys.stdout
+
+    print('%-16s %-8s %10s %8s %8s %8s' % ('file', 'zoom', 'time (s)', 'time', 'drawn', 'culled'))
+    for infile in infiles:
+        rows = []
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            svgparse.CACHE_DIR = None
+            rows.append(('all',) + time_render(infile, None))
+            svgparse.CACHE_DIR = cache_dir
+            rows.append(('index',) + time_render(infile, central_square(infile, args.fractions[0])))
+            for fraction in args.fractions:
+                # A drawing cached by an earlier render would skip the work being timed
+                for filename in os.listdir(cache_dir):
+                    if filename.endswith(svgparse.DRAWING_EXT):
+                        os.remove(os.path.join(cache_dir, filename))
+                rows.append(('%g' % fraction,) + time_render(infile, central_square(infile, fraction)))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        base = rows[0][1]
+        for i, (label, seconds, num_paths, num_culled) in enumerate(rows):
+            print('%-16s %-8s %10.3f %7.0f%% %8d %8d' % (os.path.basename(infile)[:16] if i == 0 else '', label,
+                                                        seconds, 100.0 * seconds / max(base, 1e-9), num_paths, num_culled))
+    shutil.rmtree(workdir)
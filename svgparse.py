@@ -4,7 +4,7 @@
 ## Turtle Graphics Demonstration
 ## CS 61A Discussion 9
 
-## USAGE: `python3 svgparse.py [--scheme] <input filepath>`
+## USAGE: `python3 svgparse.py [--scheme | --raster | --drawing] [--jobs N] <input filepath> [<input filepath> ...]`
 
 ##############
 # PARAMETERS #
@@ -13,15 +13,25 @@
 fill_shapes      = False
 draw_boundary    = False
 step_size        = 0.5
+flatten_tolerance = None  # if set, sample each curve adaptively to within this many pixels (instead of by step_size)
 bezier_option    = 'cubic'
-cubic_unfinished = True  # good one to play with (to guarantee clipping, set to False)
+cubic_unfinished = True  # good one to play with
+standard_paths   = False  # read relative curve points as the SVG spec does (see TOKENIZE_PATH)
 animation        = False
 clip             = True
 intersperse      = True  # intersperse group paths to diversify colors
+color_batch      = None  # with INTERSPERSE: merge groups of the same color and draw this many of its paths per turn
+simplify_tolerance = None  # max deviation (in pixels) when simplifying paths; 0 = lossless only, None = off
+reorder_paths    = None  # 'greedy' or '2opt' to reorder the paths of each color for less pen-up travel; None = off
+reverse_paths    = True  # let REORDER_PATHS draw paths backwards; '2opt' needs this, and falls back to 'greedy' without it
+zoom             = None  # (x, y, width, height) in viewBox units: draw only this part of the image, enlarged
+lod_pixels       = None  # collapse paths less than this many pixels across into a single line; None = off
+lod_drop         = False  # with LOD_PIXELS, leave those paths out instead
 
 # Python-specific (won't work if converting to Scheme code)
 pen_width   = 1  # set to None for default
 save_output = False
+bulk_canvas = True  # without ANIMATION, draw each polyline onto the Tk canvas in one go instead of moving the turtle
 
 # Only set these if you actually know the window size
 DEFAULT_WINDOW_WIDTH  = 720
@@ -31,24 +41,37 @@ DEFAULT_WINDOW_HEIGHT = 675
 WINDOW_WIDTH_OVERRIDE  = 550  # either an integer or None
 WINDOW_HEIGHT_OVERRIDE = 550  # either an integer or None
 
-NO_ANIM_UPDATE      = 'group'  # either 'path' or 'group' (case-sensitive); 'group' is faster but less entertaining
-NO_ANIM_UPDATE_RATE = 2000
+NO_ANIM_UPDATE      = 'time'  # 'path', 'group' or 'time' (case-sensitive); 'group' is faster but less entertaining
+NO_ANIM_UPDATE_RATE = 2000  # with 'path' or 'group', the number of paths or groups between updates
+NO_ANIM_FPS         = 30  # with 'time', how many times per second to update the screen (time permitting)
+NO_ANIM_SKETCH      = None  # with BULK_CANVAS, sketch the drawing first, simplified to within this many pixels (e.g. 2)
+
+# Compiled path cache (off unless CACHE_DIR names a folder for it, e.g. '.turtledraw_cache')
+CACHE_DIR       = None
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # least recently used entries are evicted beyond this size
+
+# Scheme-specific
+SCHEME_FLUSH_SIZE = 1 << 16  # number of characters of Scheme code to buffer before writing to the output file
+SCHEME_PRECISION  = 6  # number of decimal places in Scheme output
+SCHEME_COMPACT    = False  # write each polyline as a quoted list of (heading distance) moves, walked by a helper
+SCHEME_LIST_SIZE  = 100  # with SCHEME_COMPACT, the most moves per list
 
 """
 svgparse.py
 Procedural image drawing/conversion using turtle graphics
 
 This script parses SVG files and either draws them using turtle graphics OR converts them into Scheme turtle code.
-Of the SVG specification, includes support for <path> elements with `d` attributes and `M` / `c` / `z`
-path data commands. Assumes that [fill] colors are determined by an enclosing `g` container.
+Of the SVG specification, includes support for <path> elements with `d` attributes and all path data commands
+(see TOKENIZE_PATH). Assumes that [fill] colors are determined by an enclosing `g` container.
 
 
 Specification of supported SVG v1.0 elements and attributes:
 ---
 - <svg>    metadata about image
-- width    viewport (pixel) width
-- height   viewport (pixel) height
+- width    viewport (pixel) width (only used if there is no viewBox)
+- height   viewport (pixel) height (only used if there is no viewBox)
 - viewBox  four numbers min-x, min-y, width, and height, which specify the shape of the user coordinate system
+           (separated by whitespace and/or commas; see VIEW_BOX)
 - <g>      container used to group SVG elements
 - fill     specifies the drawing color within a group
 - <path>   specifies a path through control points
@@ -58,6 +81,10 @@ Specification of supported SVG v1.0 elements and attributes:
 - l        draws a line, dx to the right and dy downward
 - c        cubic Bézier curve, where coordinates are specified relative to the intial point
 - z        close path
+- L / H / V         line to (x, y), to x, or to y; `l` / `h` / `v` are relative
+- C / S / Q / T     cubic and quadratic Bézier curves (S and T reflect the previous control point); relative in lowercase
+- A                 elliptical arc, approximated by Bézier curves; `a` is relative
+Numbers may be integers or floats (with exponents), separated by whitespace, commas, or nothing at all where unambiguous.
 
 
 For future reference:
@@ -93,6 +120,10 @@ B(t) = (1 - t)^3 * P0 + 3(1 - t)^2 * t * P1 + 3(1 - t) * t^2 * P2 + t^3 * P3,
 using values of t from 0 to 1, spaced out by STEP_SIZE (a parameter specified at the top of the file).
 Ideally, STEP_SIZE should be very small, <= 0.10 at the very least.
 
+Rather than evaluating one segment at a time, we tokenize an entire `d` attribute into an N x 4 x 2 array
+of control points and multiply it by a single D x 4 basis matrix (T * M, computed once per STEP_SIZE).
+This yields the points of every segment in the path at once, which are then joined into one polyline.
+
 
 To implement piecewise quadratic Bézier curves:
 ---
@@ -100,11 +131,96 @@ For each value of t, we calculate the corresponding curve point via the explicit
 B(t) = (1 - t)^2 * P0 + 2(1 - t) * t * P1 + t^2 * P2.
 
 
+Reading the SVG file:
+---
+The file is streamed rather than loaded as a tree, so that drawing can begin right away and memory use
+does not grow with the size of the input. Without INTERSPERSE, paths are drawn as soon as they are read.
+With INTERSPERSE, a first pass records only the fill and the byte offset of each path in every group;
+the `d` attributes are then read back from the file in interspersed order.
+
+
+Drawing order:
+---
+By default, the paths of each color are drawn in document order, so the pen often jumps across the canvas between them.
+If REORDER_PATHS is set, every path is compiled once up front to find where it starts and ends. Colors still take turns
+as above, but each turn goes to the nearest remaining path of that color (optionally entered from its end, and
+optionally improved by 2-opt); the paths are then compiled again in their new order as they are drawn.
+
+With INTERSPERSE, every path normally comes with a color change. Setting COLOR_BATCH merges the groups of each color
+and lets each color draw COLOR_BATCH paths per turn, so that colors change COLOR_BATCH times less often while still
+being spread over the whole drawing. Independently of this, the turtle commands keep track of the pen (see PENSTATE)
+and leave out color, pen size and heading changes that would not change anything, as well as pen-up moves to where
+the turtle already is (or that are immediately followed by another pen-up move).
+
+
+Zooming and level of detail:
+---
+Setting ZOOM (or passing --zoom X Y W H) draws just that rectangle of the SVG, scaled up to fill the canvas
+(the viewBox's own min-x and min-y are respected too). Paths that lie entirely outside of it are skipped before
+they are read or flattened, using a grid index over their bounding boxes (see SPATIAL INDEX). With CACHE_DIR set,
+the index is computed once per file and kept in the cache, so zooming in on a large file then takes time in proportion
+to what can be seen.
+The remaining paths are drawn in the same order as in the whole drawing, and clipped as usual.
+Independently of this, LOD_PIXELS replaces paths that are too small to make out at the current scale
+by a single line each (or, with LOD_DROP, leaves them out), without evaluating any of their curves.
+
+Watch mode:
+---
+With --watch, the script keeps running after drawing (or converting) its input, and does so again whenever a parameter
+is changed, either by typing `name = value` into it or by saving a file of such lines given as --config, or whenever
+an input file is saved. Every render is split into the stages of WATCH_STAGES (parse, flatten, simplify, order, draw);
+the compiled paths are kept in memory (see DRAWINGSESSION), and only the stages after the earliest one that a change
+affects are run again. Since paths are remembered by their path data, editing an SVG file only recompiles the paths
+that were edited; the drawing is then put together and redrawn (or its output file rewritten) from memory.
+
+Using it as a library:
+---
+`import svgparse` only loads what every conversion needs (NumPy and the standard library); Tk and the turtle module,
+canvasvg and CairoSVG, the multiprocessing module and the watch mode's threads are only imported by the code
+that uses them, so the Scheme, raster and drawing backends never load Tk or Cairo. CONVERT(PATH, CONFIG, BACKEND)
+converts a single file, where CONFIG is a Config: a full set of the parameters at the top of this file, e.g.
+svgparse.convert('in/bird.svg', svgparse.Config(step_size=0.25), 'raster'). Every stage reads its parameters
+from the Config (as CONTEXT.CONFIG), and cache entries are written to temporary files first (see TEMP_PATH),
+so conversions with different Configs can run side by side, even in threads, as long as their outputs differ.
+Run as a script, `python -m svgparse` starts up faster than `python svgparse.py`, since Python can then reuse
+the compiled module rather than compiling it again.
+
 Result of running the script:
 ---
 if --scheme: Once all of the information is parsed, it is converted into Scheme code
              and saved under the name <input basename>.scm in the folder OUTFOLDER.
+             With SCHEME_COMPACT, each polyline is written as a quoted list of moves rather than
+             as one command per move (see SCHEMEEMITTER), which makes the file about 40% smaller.
+             Multiple input files are converted in parallel, by a pool of --jobs processes.
+if --raster: The image is drawn into memory with NumPy (no window, Tk, or Cairo involved)
+             and saved as <input basename>.png in the folder OUTFOLDER. As with --scheme,
+             multiple input files are converted in parallel.
+if --drawing: The compiled paths are saved as <input basename>.tdraw in the folder OUTFOLDER (see below),
+             to be drawn later by any of the other modes (which accept .tdraw files as well as SVGs).
 otherwise:   The image will be drawn on the fly using turtle graphics.
+             Unless ANIMATION is on, BULK_CANVAS skips the turtle itself and puts each polyline
+             onto its canvas as a single line (see CANVASRENDERER), which is much faster.
+             The screen is updated NO_ANIM_FPS times per second (see FRAMESCHEDULER), optionally
+             after a quick sketch of the whole drawing (NO_ANIM_SKETCH) that the real one then replaces.
+             Multiple input files are drawn one after another (click the window to move on to the next one).
+
+
+Drawing files (.tdraw):
+---
+A drawing file holds the compiled drawing (every record of ITER_DRAWING) in a form that can be memory-mapped
+and drawn without any parsing. The compiled path cache uses the same format. All values are little-endian.
+
+- Header (the first 256 bytes, zero-padded), laid out as DRAWING_HEADER / DRAWING_HEADER_FIELDS:
+  the magic string 'TURTLEDR', the format version, the size of a coordinate (4 for float32 or 8 for float64),
+  the window size (2 x uint32), then the viewBox size, canvas size, x/y scales and x/y shifts (8 x float64)
+  which map SVG coordinates onto turtle coordinates (see CONTEXT.SVG_TO_TURTLE), then the number of points,
+  subpaths, records and colors (4 x uint64), and the byte offsets of the subpath, record and color tables (3 x uint64).
+- Points, starting at byte 256: one (x, y) pair per point, in turtle coordinates, for all paths back to back.
+- Subpath table: one uint64 per subpath, giving the index of its first point, plus a final entry (the number of points).
+- Record table: 24 bytes per record (DRAWING_RECORD), in drawing order: the group index (int32), the color to switch to
+  (int32 index into the color table, or -1 to keep the current color), and the first subpath and number of subpaths
+  of the record's path (2 x int64; the number of subpaths is -1 for a record that only starts a group).
+- Color table: one 16-byte, NUL-padded ASCII string per color.
 """
 
 #################
@@ -114,121 +230,495 @@ otherwise:   The image will be drawn on the fly using turtle graphics.
 import numpy as np
 M = np.array([[1, 0, 0, 0], [-3, 3, 0, 0], [3, -6, 3, 0], [-1, 3, -3, 1]])
 
-def cubic_bezier(P0, P1, P2, P3):
-    """Returns a D x 2 matrix of points, parameterized by values of t from 0 to 1 with increment STEP_SIZE,
-    representing the cubic Bézier curve specified by control points P0 -> P3.
-    
-    Input: each point should be a tuple consisting of an x- and a y-coordinate.
-    """
-    t_range = list(np.arange(0, 1, step_size))
-    if not cubic_unfinished:
-        t_range.append(1.0)
-    t_mat = np.array([[1, t, t * t, t * t * t] for t in t_range])
-    P_mat = np.array([P0, P1, P2, P3])
-    return np.dot(t_mat, np.dot(M, P_mat))  # optimal chain multiplication order
-
-def quadratic_bezier(P0, P1, P2):
-    """Returns a D x 2 matrix of points, parameterized by values of t from 0 to 1 with increment STEP_SIZE,
-    representing the cubic Bézier curve specified by control points P0 -> P2.
-    
-    Input: each point should be a tuple consisting of an x- and a y-coordinate.
+_basis_cache = {}
+
+def bezier_basis(num_pts, step, endpoint):
+    """Returns the D x NUM_PTS matrix which maps the control points of a single Bézier segment
+    to the D points on its curve, parameterized by values of t from 0 to 1 with increment STEP
+    (and t = 1 itself if ENDPOINT is true).
+
+    Every segment in a drawing shares this matrix, so it is computed once per argument combination.
+    """
+    key = (num_pts, step, endpoint)
+    if key not in _basis_cache:
+        t_range = np.arange(0, 1, step)
+        if endpoint:
+            t_range = np.append(t_range, 1.0)
+        if num_pts == 3:
+            basis = np.stack([(1 - t_range) * (1 - t_range), 2 * (1 - t_range) * t_range, t_range * t_range], axis=1)
+        else:
+            basis = np.dot(np.vander(t_range, 4, increasing=True), M)
+        _basis_cache[key] = basis
+    return _basis_cache[key]
+
+def bezier_num_pts(option):
+    """Returns NUM_REQ_PTS, the number of control points per segment for the given BEZIER_OPTION
+    (3 for quadratic curves, 4 for cubic ones). This is looked up whenever it is needed
+    (rather than once, on import), so that BEZIER_OPTION can be changed at any time.
     """
-    pts = []
-    for t in list(np.arange(0, 1, step_size)) + [1.0]:
-        pts.append(np.array([
-            (1 - t) * (1 - t) * P0[0] + 2 * (1 - t) * t * P1[0] + t * t * P2[0],
-            (1 - t) * (1 - t) * P0[1] + 2 * (1 - t) * t * P1[1] + t * t * P2[1],
-        ]))
-    return np.array(pts)
+    return 3 if option.startswith('quad') else 4
 
-if bezier_option.startswith('quad'):
-    bezier, num_req_pts = quadratic_bezier, 3
-else:
-    bezier, num_req_pts = cubic_bezier, 4
+def bezier_segments(ctrl_pts, config):
+    """Evaluates every segment at once.
+    Input: ctrl_pts - an N x NUM_REQ_PTS x 2 array of control points (one row per segment)
+           config - the Config to take STEP_SIZE, BEZIER_OPTION and CUBIC_UNFINISHED from
+    Output: an N x D x 2 array of curve points, one row per segment (sampled every STEP_SIZE in t)
+    """
+    num_req_pts = bezier_num_pts(config.bezier_option)
+    basis = bezier_basis(num_req_pts, config.step_size, num_req_pts == 3 or not config.cubic_unfinished)
+    return np.matmul(basis, ctrl_pts)
+
+MAX_SUBDIVISIONS = 256
+
+def bezier_subdivisions(ctrl_pts, tolerance):
+    """Returns, for every segment in CTRL_PTS (an N x NUM_REQ_PTS x 2 array), the number of equal steps in t
+    needed for the chords of the curve to stay within TOLERANCE of it.
+
+    By Wang's formula, a Bézier curve of degree n is within tolerance of its chords after
+    sqrt(n(n - 1) / 8 * L / tolerance) steps, where L is the length of the longest second difference
+    of the control points. Short or flat curves therefore get a single step, and long ones get more.
+
+    >>> bezier_subdivisions(np.array([[[0, 0], [1, 0], [2, 0], [3, 0]], [[0, 0], [0, 100], [100, 100], [100, 0]]]), 0.5)
+    array([ 1, 15])
+    """
+    degree = ctrl_pts.shape[1] - 1
+    second_diffs = ctrl_pts[:, :-2] - 2 * ctrl_pts[:, 1:-1] + ctrl_pts[:, 2:]
+    longest = np.hypot(second_diffs[..., 0], second_diffs[..., 1]).max(axis=1)
+    steps = np.ceil(np.sqrt(degree * (degree - 1) / 8.0 * longest / tolerance))
+    return np.clip(steps, 1, MAX_SUBDIVISIONS).astype(int)
+
+def bezier_adaptive(ctrl_pts, num_steps, endpoint):
+    """Evaluates every segment in CTRL_PTS at t = 0, 1 / k, ..., (k - 1) / k (and t = 1 if ENDPOINT is true),
+    where k is the segment's entry in NUM_STEPS.
+    Returns (samples, seg_idx): the curve points of all segments, concatenated in order, and the segment of each.
+    """
+    counts = num_steps + 1 if endpoint else num_steps
+    seg_idx = np.repeat(np.arange(len(ctrl_pts)), counts)
+    firsts = np.cumsum(counts) - counts
+    t = (np.arange(len(seg_idx)) - firsts[seg_idx]) / num_steps[seg_idx].astype(float)
+    s = 1 - t
+    if ctrl_pts.shape[1] == 3:
+        basis = np.stack([s * s, 2 * s * t, t * t], axis=1)
+    else:
+        basis = np.stack([s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t], axis=1)
+    return np.einsum('sr,srd->sd', basis, ctrl_pts[seg_idx]), seg_idx
 
 ###################
 # TURTLE GRAPHICS #
 ###################
 
-def turtle_pensize(width):
-    """Set the width of the pen."""
-    if direct_draw:
-        turtle.pensize(width)
+import re
 
-def turtle_speed(speed, overwrite=False):
-    if direct_draw:
-        turtle.speed(speed)
-    else:
-        with open(outfile, 'w' if overwrite else 'a') as out:
-            out.write('(speed %d)\n' % speed)
+class SchemeEmitter(object):
+    """Accumulates Scheme turtle commands and writes them to OUTFILE through a single open handle.
+    Commands are buffered in memory and written out in chunks of roughly FLUSH_SIZE characters.
+    Numbers are written with PRECISION decimal places.
 
-def turtle_color(color, overwrite=False):
-    if direct_draw:
-        turtle.color(color)
-    else:
-        with open(outfile, 'w' if overwrite else 'a') as out:
-            out.write('(color "%s")\n' % color)
+    If COMPACT is set, polylines are written as data rather than as commands: each one becomes a quoted list
+    of heading/distance pairs (at most LIST_SIZE of them, with trailing zeros left out), walked by WALK_HELPER,
+    which is defined at the top of the file. LIST_SIZE keeps the helper's recursion shallow
+    for interpreters which do not run tail calls in constant space.
+    """
 
-def turtle_begin_fill():
-    if direct_draw:
-        turtle.begin_fill()
-    else:
-        with open(outfile, 'a') as out:
-            out.write('(begin_fill)\n')
+    WALK_HELPER = ('(define (walk moves) (if (null? moves) nil (begin '
+                   '(setheading (car moves)) (forward (car (cdr moves))) (walk (cdr (cdr moves))))))\n')
+    TRAILING_ZEROS_RE = re.compile(r'\.?0+(?=[ )])')
+
+    def __init__(self, path, flush_size=None, compact=None, precision=None, list_size=None):
+        self.out = open(path, 'w')
+        self.flush_size = SCHEME_FLUSH_SIZE if flush_size is None else flush_size
+        self.compact = SCHEME_COMPACT if compact is None else compact
+        self.precision = SCHEME_PRECISION if precision is None else precision
+        self.list_size = SCHEME_LIST_SIZE if list_size is None else list_size
+        self.chunks, self.size = [], 0
+        self.number = '%%.%df' % self.precision
+        if self.compact:
+            self.write(self.WALK_HELPER)
+
+    def write(self, code):
+        """Queues CODE (one or more complete lines of Scheme)."""
+        self.chunks.append(code)
+        self.size += len(code)
+        if self.size >= self.flush_size:
+            self.flush()
+
+    def write_position(self, x, y):
+        """Queues a move to (X, Y), lifting the pen for it."""
+        self.write('(penup) (setposition %s %s) (pendown)\n' % (self.number, self.number) % (x, y))
+
+    def write_moves(self, angles, distances, turns=None):
+        """Queues a (setheading) (forward) line for every move, given arrays of ANGLES and DISTANCES.
+        If TURNS is given, moves where it is False only get a (forward), keeping the previous heading.
+        In compact mode, the moves are queued as (walk) lists instead, which always include the heading.
+        """
+        if self.compact:
+            moves = np.empty(2 * len(angles))
+            moves[0::2], moves[1::2] = angles, distances
+            step = 2 * self.list_size
+            code = ''.join(["(walk '(%s))\n" % ' '.join([self.number] * len(part)) % tuple(part.tolist())
+                            for part in (moves[i:i + step] for i in range(0, len(moves), step))])
+            self.write(self.TRAILING_ZEROS_RE.sub('', code) if self.precision > 0 else code)
+            return
+        move, forward = '(setheading %s) (forward %s)\n' % (self.number, self.number), '(forward %s)\n' % self.number
+        if turns is None or turns.all():
+            moves = np.empty(2 * len(angles))
+            moves[0::2], moves[1::2] = angles, distances
+            self.write(move * len(angles) % tuple(moves.tolist()))
+            return
+        distance_idx = np.arange(len(angles)) + np.cumsum(turns)
+        moves = np.empty(len(angles) + np.count_nonzero(turns))
+        moves[distance_idx] = distances
+        moves[distance_idx[turns] - 1] = angles[turns]
+        template = ''.join([move if turn else forward for turn in turns.tolist()])
+        self.write(template % tuple(moves.tolist()))
+
+    def flush(self):
+        self.out.write(''.join(self.chunks))
+        self.chunks, self.size = [], 0
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+class PenState(object):
+    """The state of the turtle as of the last command sent to it, so that commands which would not change anything
+    can be left out: the pen COLOR, WIDTH and HEADING (None until first set) and the turtle's POSITION.
+    Pen-up moves are put off until the next line is drawn (PENDING holds the destination), so that consecutive moves
+    collapse into one and moves to where the turtle already is disappear. Color changes are put off in the same way
+    (PENDING_COLOR), so that paths which turn out to draw nothing (such as those clipped away) leave no trace.
+    """
 
-def turtle_end_fill():
-    if direct_draw:
-        turtle.end_fill()
+    def __init__(self):
+        self.color, self.width, self.heading = None, None, None
+        self.position, self.pending, self.pending_color = (0.0, 0.0), None, None
+
+def turtle_pensize(ctx, width):
+    """Set the width of the pen."""
+    if width == ctx.pen.width:
+        return
+    ctx.pen.width = width
+    if ctx.renderer is not None:
+        ctx.renderer.pensize(width)
+    elif ctx.direct_draw:
+        ctx.turtle.pensize(width)
+
+def turtle_speed(ctx, speed):
+    if ctx.direct_draw:
+        ctx.turtle.speed(speed)
+    elif ctx.scheme_out is not None:
+        ctx.scheme_out.write('(speed %d)\n' % speed)
+
+def turtle_color(ctx, color):
+    """Sets the pen color, once something is drawn with it (see TURTLE_COLOR_READY)."""
+    ctx.pen.pending_color = color
+
+def turtle_color_ready(ctx):
+    """Makes the pending color change (if any), unless the pen already has that color."""
+    color, ctx.pen.pending_color = ctx.pen.pending_color, None
+    if color is None or color == ctx.pen.color:
+        return
+    ctx.pen.color = color
+    if ctx.renderer is not None:
+        ctx.renderer.color(color)
+    elif ctx.direct_draw:
+        ctx.turtle.color(color)
     else:
-        with open(outfile, 'a') as out:
-            out.write('(end_fill)\n')
+        ctx.scheme_out.write('(color "%s")\n' % color)
+
+def turtle_begin_fill(ctx):
+    turtle_color_ready(ctx)
+    if ctx.renderer is not None:
+        ctx.renderer.begin_fill()
+    elif ctx.direct_draw:
+        ctx.turtle.begin_fill()
+    else:
+        ctx.scheme_out.write('(begin_fill)\n')
 
-def turtle_hide():
-    if direct_draw:
-        turtle.hideturtle()
+def turtle_end_fill(ctx):
+    if ctx.renderer is not None:
+        ctx.renderer.end_fill()
+    elif ctx.direct_draw:
+        ctx.turtle.end_fill()
     else:
-        with open(outfile, 'a') as out:
-            out.write('(hideturtle)\n')
+        ctx.scheme_out.write('(end_fill)\n')
+
+def turtle_hide(ctx):
+    if ctx.direct_draw:
+        ctx.turtle.hideturtle()
+    elif ctx.scheme_out is not None:
+        ctx.scheme_out.write('(hideturtle)\n')
 
-def turtle_setpos(x, y, overwrite=False, keep_pen_down=False):
-    """Moves to a certain position.
+def turtle_setpos(ctx, x, y):
+    """Moves to a certain position (with the pen up).
     Input: (x, y) - a point in absolute turtle coordinates
+    The move is only made once something is drawn from there (see TURTLE_PEN_READY).
     """
-    if direct_draw:
-        if not keep_pen_down:
-            turtle.penup()
-        turtle.setposition(x, y)
-        if not keep_pen_down:
-            turtle.pendown()
-    else:
-        with open(outfile, 'w' if overwrite else 'a') as out:
-            if keep_pen_down:
-                out.write('(setposition %f %f)\n' % (x, y))
-            else:
-                out.write('(penup) (setposition %f %f) (pendown)\n' % (x, y))
-    return x, y
-
-def turtle_traverse(pts, setpos=True):
+    ctx.pen.pending = (x, y)
+
+def turtle_pen_ready(ctx):
+    """Makes the pending color change (see TURTLE_COLOR_READY) and pen-up move (if any, unless the turtle is already there)."""
+    turtle_color_ready(ctx)
+    pending, ctx.pen.pending = ctx.pen.pending, None
+    if pending is None or pending == ctx.pen.position:
+        return
+    ctx.pen.position = pending
+    if ctx.renderer is not None:
+        pass  # renderers only deal in whole polylines (see TURTLE_TRAVERSE)
+    elif ctx.direct_draw:
+        ctx.turtle.penup()
+        ctx.turtle.setposition(*pending)
+        ctx.turtle.pendown()
+    elif ctx.scheme_out is not None:
+        ctx.scheme_out.write_position(*pending)
+
+def turtle_traverse(ctx, pts, setpos=True):
     """Draws straight lines between the given points.
     Input: pts - a D x 2 matrix of points (in absolute turtle coordinates)
+    A heading is only set when it differs from the previous one (to the precision of the Scheme output).
     """
-    if not direct_draw:
-        out = open(outfile, 'a')
-    prev_x, prev_y = turtle_clip(*pts[0]) if clip else pts[0]
+    if ctx.renderer is not None:
+        turtle_color_ready(ctx)
+        ctx.renderer.polyline(np.asarray(pts, dtype=float))
+        return
+    pts = np.asarray(pts, dtype=float)
     if setpos:
-        turtle_setpos(prev_x, prev_y)
-    for x, y in pts[1:]:
-        if clip:
-            x, y = turtle_clip(x, y)
-        angle, distance = angle_dist((prev_x, prev_y), (x, y))
-        if direct_draw:
-            turtle.setheading(angle)
-            turtle.forward(distance)
+        turtle_setpos(ctx, *pts[0].tolist())
+    if len(pts) < 2:
+        return
+    turtle_pen_ready(ctx)
+    angles, distances = polyline_moves(pts)
+    headings = np.round(angles, ctx.config.SCHEME_PRECISION)
+    turns = np.empty(len(headings), dtype=bool)
+    turns[0] = headings[0] != ctx.pen.heading
+    turns[1:] = headings[1:] != headings[:-1]
+    ctx.pen.heading, ctx.pen.position = headings[-1], tuple(pts[-1].tolist())
+    if ctx.direct_draw:
+        for angle, distance, turn in zip(angles.tolist(), distances.tolist(), turns.tolist()):
+            if turn:
+                ctx.turtle.setheading(angle)
+            ctx.turtle.forward(distance)
+    else:
+        ctx.scheme_out.write_moves(angles, distances, turns)
+
+#################
+# RASTER OUTPUT #
+#################
+
+import struct
+
+# The basic color keywords of CSS (and so SVG), which Tk understands as well
+NAMED_COLORS = {'black': '#000000', 'silver': '#C0C0C0', 'gray': '#808080', 'grey': '#808080', 'white': '#FFFFFF',
+                'maroon': '#800000', 'red': '#FF0000', 'purple': '#800080', 'fuchsia': '#FF00FF', 'magenta': '#FF00FF',
+                'green': '#008000', 'lime': '#00FF00', 'olive': '#808000', 'yellow': '#FFFF00', 'navy': '#000080',
+                'blue': '#0000FF', 'teal': '#008080', 'aqua': '#00FFFF', 'cyan': '#00FFFF', 'orange': '#FFA500'}
+
+_unknown_colors = set()
+
+def color_to_rgb(color):
+    """Converts a color of the form '#RRGGBB' or '#RGB', or one of NAMED_COLORS (in any case),
+    to an array of three 8-bit values. Any other color is drawn in black, with a warning (once per color).
+
+    >>> color_to_rgb('#724818').tolist(), color_to_rgb('#F80').tolist(), color_to_rgb('NAVY').tolist()
+    ([114, 72, 24], [255, 136, 0], [0, 0, 128])
+    """
+    value = NAMED_COLORS.get(color.lower(), color)
+    digits = value[1:] if value.startswith('#') else ''
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    if len(digits) == 6:
+        try:
+            return np.array([int(digits[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.uint8)
+        except ValueError:
+            pass
+    if color not in _unknown_colors:
+        _unknown_colors.add(color)
+        print('WARNING: unrecognized color (%s), drawn in black' % color)
+    return np.zeros(3, dtype=np.uint8)
+
+def write_png(filename, img):
+    """Writes IMG (an H x W x 3 array of 8-bit values) to FILENAME as an RGB PNG."""
+    import zlib
+    height, width = img.shape[:2]
+
+    def _chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), img.reshape(height, -1)])  # filter type 0
+    with open(filename, 'wb') as out:
+        out.write(b'\x89PNG\r\n\x1a\n')
+        out.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        out.write(_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)))
+        out.write(_chunk(b'IEND', b''))
+
+class Rasterizer(object):
+    """Draws polylines (in absolute turtle coordinates) into a WIDTH x HEIGHT image held in memory,
+    as the turtle would on a canvas of that size: (0, 0) is the center of the image, +y is up.
+
+    As in Tk, filled polygons use the even-odd rule and are painted underneath the lines drawn while filling,
+    and their outlines include any pen-up moves made along the way.
+    """
+
+    def __init__(self, width, height):
+        self.img = np.full((height, width, 3), 255, dtype=np.uint8)
+        self.rgb = np.zeros(3, dtype=np.uint8)
+        self.width = 1
+        self.fill_path, self.fill_strokes = None, None
+        self._pens = {}
+
+    def to_pixels(self, pts):
+        """Converts turtle coordinates to (fractional) pixel coordinates, with +y down."""
+        height, width = self.img.shape[:2]
+        return pts * (1, -1) + (width / 2.0, height / 2.0)
+
+    def color(self, color):
+        self.rgb = color_to_rgb(color)
+
+    def pensize(self, width):
+        self.width = width
+
+    def begin_fill(self):
+        self.fill_path, self.fill_strokes = [], []
+
+    def end_fill(self):
+        if self.fill_path:
+            self.fill(np.concatenate(self.fill_path), self.rgb)
+        for pts, rgb, width in self.fill_strokes:
+            self.stroke(pts, rgb, width)
+        self.fill_path, self.fill_strokes = None, None
+
+    def polyline(self, pts):
+        """Moves to the first point of PTS with the pen up, then draws lines through the rest."""
+        if self.fill_path is not None:
+            self.fill_path.append(pts)
+            self.fill_strokes.append((pts, self.rgb, self.width))
         else:
-            out.write('(setheading %f) (forward %f)\n' % (angle, distance))
-        prev_x, prev_y = x, y
-    if not direct_draw:
-        out.close()
+            self.stroke(pts, self.rgb, self.width)
+
+    def pen_offsets(self, width):
+        """Returns the (dx, dy) pixel offsets covered by a round pen of the given WIDTH."""
+        if width not in self._pens:
+            radius = max(width or 1, 1) / 2.0
+            r = int(np.ceil(radius))
+            dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+            in_pen = dx * dx + dy * dy <= radius * radius if radius > 0.5 else (dx == 0) & (dy == 0)
+            self._pens[width] = dx[in_pen], dy[in_pen]
+        return self._pens[width]
+
+    def stroke(self, pts, rgb, width):
+        """Draws lines of the given WIDTH through PTS, by stamping a round pen at most half a pixel apart."""
+        if len(pts) < 2:
+            return
+        px = self.to_pixels(pts)
+        deltas = np.diff(px, axis=0)
+        num_samples = np.ceil(np.hypot(deltas[:, 0], deltas[:, 1]) * 2).astype(int) + 1
+        seg_idx = np.repeat(np.arange(len(deltas)), num_samples)
+        firsts = np.cumsum(num_samples) - num_samples
+        t = (np.arange(len(seg_idx)) - firsts[seg_idx]) / np.maximum(num_samples - 1, 1)[seg_idx].astype(float)
+        samples = px[seg_idx] + deltas[seg_idx] * t[:, None]
+
+        pen_dx, pen_dy = self.pen_offsets(width)
+        cols = (np.floor(samples[:, 0]).astype(int)[:, None] + pen_dx).ravel()
+        rows = (np.floor(samples[:, 1]).astype(int)[:, None] + pen_dy).ravel()
+        height, width = self.img.shape[:2]
+        visible = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        self.img[rows[visible], cols[visible]] = rgb
+
+    def fill(self, pts, rgb):
+        """Fills the (implicitly closed) polygon PTS using the even-odd rule, sampling at pixel centers."""
+        height, width = self.img.shape[:2]
+        px = self.to_pixels(pts)
+        x0, y0 = px[:, 0], px[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+        # Every edge crosses the rows whose centers lie in [min(y0, y1), max(y0, y1))
+        row_start = np.ceil(np.minimum(y0, y1) - 0.5).astype(int)
+        num_rows = np.ceil(np.maximum(y0, y1) - 0.5).astype(int) - row_start
+        edge_idx = np.repeat(np.arange(len(px)), num_rows)
+        if len(edge_idx) == 0:
+            return
+        firsts = np.cumsum(num_rows) - num_rows
+        rows = row_start[edge_idx] + np.arange(len(edge_idx)) - firsts[edge_idx]
+        e0, e1 = (x0[edge_idx], y0[edge_idx]), (x1[edge_idx], y1[edge_idx])
+        xs = e0[0] + (rows + 0.5 - e0[1]) * (e1[0] - e0[0]) / (e1[1] - e0[1])
+
+        # Consecutive crossings (per row, sorted by x) delimit the spans to fill
+        order = np.lexsort((xs, rows))
+        rows, xs = rows[order], xs[order]
+        span_rows = rows[0::2]
+        span_start = np.clip(np.ceil(xs[0::2] - 0.5).astype(int), 0, width)
+        span_end = np.clip(np.ceil(xs[1::2] - 0.5).astype(int), 0, width)
+        keep = (span_rows >= 0) & (span_rows < height) & (span_end > span_start)
+        span_rows, span_start, span_end = span_rows[keep], span_start[keep], span_end[keep]
+        if len(span_rows) == 0:
+            return
+
+        # Paint the spans within the polygon's bounding box via a running sum over each row
+        r0, c0 = span_rows.min(), span_start.min()
+        coverage = np.zeros((span_rows.max() - r0 + 1, span_end.max() - c0 + 1), dtype=np.int32)
+        np.add.at(coverage, (span_rows - r0, span_start - c0), 1)
+        np.add.at(coverage, (span_rows - r0, span_end - c0), -1)
+        inside = np.cumsum(coverage, axis=1)[:, :-1] > 0
+        self.img[r0:r0 + inside.shape[0], c0:c0 + inside.shape[1]][inside] = rgb
+
+    def save(self, filename):
+        write_png(filename, self.img)
+
+#################
+# CANVAS OUTPUT #
+#################
+
+class CanvasRenderer(object):
+    """Draws polylines (in absolute turtle coordinates) straight onto the Tk canvas of SCREEN (a turtle screen),
+    as a single line item per polyline rather than one item (and a round of turtle bookkeeping) per move.
+
+    As with the turtle, lines have round caps, and a fill is a polygon through every point visited while filling
+    (pen-up moves included) that sits underneath the lines drawn in the meantime.
+    All items are tagged with TAG, so that they can be removed again by CLEAR (which TURTLE.RESET would not do);
+    while TAGS also includes SKETCH_TAG, they are marked as part of a sketch (see SKETCH_DRAWING).
+    """
+
+    TAG = 'turtledraw'
+    SKETCH_TAG = 'turtledraw_sketch'
+
+    def __init__(self, screen):
+        self.canvas = screen.getcanvas()
+        self.tags = (self.TAG,)
+        self.scale = np.array([screen.xscale, -screen.yscale])
+        self.fg, self.width = 'black', 1
+        self.fill_item, self.fill_path = None, None
+
+    def to_canvas(self, pts):
+        """Converts turtle coordinates to a flat [x0, y0, x1, y1, ...] list of canvas coordinates (with +y down)."""
+        return (pts * self.scale).ravel().tolist()
+
+    def color(self, color):
+        self.fg = color
+
+    def pensize(self, width):
+        self.width = width
+
+    def begin_fill(self):
+        # Created now (and shaped by END_FILL) so that it stays underneath the lines drawn until then
+        self.fill_item = self.canvas.create_polygon(0, 0, 0, 0, 0, 0, fill='', outline='', tags=self.tags)
+        self.fill_path = []
+
+    def end_fill(self):
+        if sum(len(pts) for pts in self.fill_path) > 2:
+            self.canvas.coords(self.fill_item, *self.to_canvas(np.concatenate(self.fill_path)))
+            self.canvas.itemconfigure(self.fill_item, fill=self.fg)
+        self.fill_item, self.fill_path = None, None
+
+    def polyline(self, pts):
+        """Moves to the first point of PTS with the pen up, then draws lines through the rest."""
+        if self.fill_path is not None:
+            self.fill_path.append(pts)
+        if len(pts) > 1:
+            self.canvas.create_line(*self.to_canvas(pts), fill=self.fg, width=self.width,
+                                    capstyle='round', joinstyle='round', tags=self.tags)
+
+    def clear(self, tag=None):
+        """Removes everything drawn by any CanvasRenderer (or only the items with the given TAG)."""
+        self.canvas.delete(tag or self.TAG)
 
 ################
 # PATH DRAWING #
@@ -270,276 +760,1980 @@ def angle_dist(P0, P1):
     theta = theta_rad * 180 / pi  # measured counterclockwise from the +x axis
     return (450 - theta) % 360, distance
 
-def parse_path(Mx, My, clz):
-    """Parses the path and writes the corresponding Scheme code to OUTFILE.
-    Incidentally, our piecewise Bézier curves should involve 4 + 3n control points (for some n).
-    
-    It doesn't affect anything in this function,
-    but since we're still assuming the SVG coordinate system at this point,
+def polyline_moves(pts):
+    """Calculates ANGLE_DIST for every pair of consecutive points in PTS (a D x 2 matrix) at once.
+    Returns a pair of length D - 1 arrays: the headings (in the same convention) and the distances.
+
+    >>> angles, distances = polyline_moves(np.array([[1, 2], [3, 4], [3, 5], [4, 5], [4, 4], [3, 4]]))
+    >>> [round(angle, 1) for angle in angles.tolist()]
+    [45.0, 0.0, 90.0, 180.0, 270.0]
+    >>> [round(distance, 2) for distance in distances.tolist()]
+    [2.83, 1.0, 1.0, 1.0, 1.0]
+    """
+    deltas = np.diff(pts, axis=0)
+    distances = np.hypot(deltas[:, 0], deltas[:, 1])
+    theta = np.arctan2(deltas[:, 1], deltas[:, 0]) * 180 / pi  # measured counterclockwise from the +x axis
+    return (450 - theta) % 360, distances
+
+PATH_COMMANDS = 'MmZzLlHhVvCcSsQqTtAa'
+PATH_COMMAND_RE = re.compile('([%s])' % PATH_COMMANDS)
+NUMBER_PATTERN = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+NUMBER_RE = re.compile(NUMBER_PATTERN)
+ARC_RE = re.compile(r'[\s,]*'.join(['(%s)' % NUMBER_PATTERN] * 3 + ['([01])'] * 2 + ['(%s)' % NUMBER_PATTERN] * 2))
+UNEXPECTED_RE = re.compile(r'[^\d\s,.eE+\-%s]' % PATH_COMMANDS)
+NUM_ARGS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+
+def tokenize_numbers(d):
+    """Splits the path description D into its commands and their arguments, converting all of the numbers at once.
+    Numbers may be separated by whitespace and/or a comma, or not at all where the syntax allows it
+    (e.g. "M10-5.5.5" is M 10 -5.5 0.5); arc flags may also be written without separators.
+    Returns a list of (command letter, K x NUM_ARGS[command] array of arguments) pairs.
+
+    >>> for cmd, args in tokenize_numbers('M10-5.5.5.5l1e1,2 3,4zh-.5a2 2 0 014 4'):
+    ...     print('%s %s' % (cmd, args.tolist()))
+    M [[10.0, -5.5], [0.5, 0.5]]
+    l [[10.0, 2.0], [3.0, 4.0]]
+    z []
+    h [[-0.5]]
+    a [[2.0, 2.0, 0.0, 0.0, 1.0, 4.0, 4.0]]
+    """
+    unexpected = UNEXPECTED_RE.search(d)
+    if unexpected:
+        print('WARNING: unrecognized attribute (%s)' % unexpected.group(0))
+    tokens = PATH_COMMAND_RE.split(d.replace(',', ' '))
+    cmds, chunks = tokens[1::2], tokens[2::2]
+    if tokens[0].strip():
+        print('WARNING: path data does not begin with a command')
+    # Numbers are usually separated by whitespace, which STR.SPLIT handles much faster than a regular expression
+    for split in (str.split, NUMBER_RE.findall):
+        numbers, bounds = [], []
+        for cmd, args in zip(cmds, chunks):
+            bounds.append(len(numbers))
+            if cmd in 'Aa':
+                numbers.extend(n for arc in ARC_RE.findall(args) for n in arc)  # flags may run into what follows
+            else:
+                numbers.extend(split(args))
+        try:
+            values = np.array(numbers, dtype=float)
+            break
+        except ValueError:
+            continue  # some numbers run into each other (e.g. "10-5"), so match them one by one instead
+    bounds.append(len(numbers))
+
+    commands = []
+    for i, cmd in enumerate(cmds):
+        num_args = NUM_ARGS[cmd.upper()]
+        args = values[bounds[i]:bounds[i + 1]]
+        extra = len(args) % num_args if num_args else len(args)
+        if extra:
+            print('WARNING: ignoring %d extra number(s) after %s' % (extra, cmd))
+            args = args[:len(args) - extra]
+        commands.append((cmd, args.reshape(-1, num_args) if num_args else args.reshape(0, 0)))
+    return commands
+
+def arc_to_bezier(p0, rx, ry, phi, large_arc, sweep, p1, degree):
+    """Approximates the elliptical arc from P0 to P1, as described by the arguments of an SVG `A` command
+    (with the rotation PHI in degrees), by Bézier curves of the given DEGREE (2 or 3), following the SVG implementation notes.
+    Each curve covers at most a quarter (cubic) or an eighth (quadratic) of the ellipse.
+    Returns the control points of all of the curves after P0 as a (DEGREE * K) x 2 array, or None if the arc is a straight line.
+    """
+    if rx == 0 or ry == 0:
+        return None
+    if np.all(p0 == p1):
+        return np.zeros((0, 2))
+    rx, ry = abs(rx), abs(ry)
+    cos_phi, sin_phi = np.cos(np.radians(phi)), np.sin(np.radians(phi))
+    rot = np.array([[cos_phi, -sin_phi], [sin_phi, cos_phi]])
+
+    # Midpoint in the ellipse's own frame, scaling the radii up if they are too small to reach P1
+    x1, y1 = rot.T.dot((p0 - p1) / 2.0)
+    scale = (x1 / rx) ** 2 + (y1 / ry) ** 2
+    if scale > 1:
+        rx, ry = rx * sqrt(scale), ry * sqrt(scale)
+    num = rx * rx * ry * ry - rx * rx * y1 * y1 - ry * ry * x1 * x1
+    coef = sqrt(max(num, 0) / (rx * rx * y1 * y1 + ry * ry * x1 * x1)) * (-1 if large_arc == sweep else 1)
+    cx, cy = coef * rx * y1 / ry, -coef * ry * x1 / rx
+    center = rot.dot([cx, cy]) + (p0 + p1) / 2.0
+
+    theta = atan2((y1 - cy) / ry, (x1 - cx) / rx)
+    delta = atan2((-y1 - cy) / ry, (-x1 - cx) / rx) - theta
+    if sweep and delta < 0:
+        delta += 2 * pi
+    elif not sweep and delta > 0:
+        delta -= 2 * pi
+
+    num_curves = max(int(np.ceil(abs(delta) / (pi / 2 if degree == 3 else pi / 4) - 1e-9)), 1)
+    angles = theta + delta * np.arange(num_curves + 1) / num_curves
+    a0, a1 = angles[:-1], angles[1:]
+    end = np.stack([np.cos(a1), np.sin(a1)], axis=1)
+    if degree == 3:
+        k = 4.0 / 3 * np.tan((a1 - a0) / 4)
+        c0 = np.stack([np.cos(a0) - k * np.sin(a0), np.sin(a0) + k * np.cos(a0)], axis=1)
+        c1 = np.stack([np.cos(a1) + k * np.sin(a1), np.sin(a1) - k * np.cos(a1)], axis=1)
+        unit = np.stack([c0, c1, end], axis=1)
+    else:
+        mid = (a0 + a1) / 2
+        c0 = np.stack([np.cos(mid), np.sin(mid)], axis=1) / np.cos((a1 - a0) / 2)[:, None]
+        unit = np.stack([c0, end], axis=1)
+    ctrl_pts = (unit.reshape(-1, 2) * (rx, ry)).dot(rot.T) + center
+    ctrl_pts[-1] = p1
+    return ctrl_pts
+
+def tokenize_path(d, config):
+    """Tokenizes the path description D (e.g. "M25 50 c0 50 125 0 0 -50") into the control points of all of its segments.
+    Every SVG path command is supported (M, L, H, V, C, S, Q, T, A and Z, both absolute and relative).
+    Quadratic curves are raised to cubics (and arcs approximated by cubics) when BEZIER_OPTION is 'cubic',
+    and arcs are approximated by quadratics when it is 'quadratic'. Curve control points form a single stream,
+    from which a piecewise Bézier curve takes NUM_REQ_PTS - 1 new control points per segment.
+
+    Unless STANDARD_PATHS is set, paths are read the classic way (as in the rest of this project):
+    every relative control point of a `c` / `s` / `q` curve is taken relative to the previous control point
+    (rather than to the start of the segment), and `z` closes the path in the current mode (line or curve).
+
+    We're still assuming the SVG coordinate system here, so
     +x -> right
     +y -> down
 
-    Input:
-    - Mx, My: integer (x, y) starting point coordinates
-    - clz: the path description as a list of string coordinates and `c` / `l` / `z` / `m` labels
-    """
-    mode, close = None, False
-    ctrl_pts_svg = [(Mx, My)]
-    ctrl_pts_tur = [svg_to_turtle(Mx, My)]
-    turtle_setpos(*ctrl_pts_tur[-1])
-    prev_move_svg = ctrl_pts_svg[-1]
-
-    def _rel_draw(dx, dy):
-        abs_pt_svg = (ctrl_pts_svg[-1][0] + dx, ctrl_pts_svg[-1][1] + dy)
-        abs_pt_tur = svg_to_turtle(*abs_pt_svg)
-        if mode == 'curve' and len(ctrl_pts_tur) < num_req_pts:
-            ctrl_pts_svg.append(abs_pt_svg)
-            ctrl_pts_tur.append(abs_pt_tur)
-        elif mode == 'line':
-            turtle_traverse(np.array([ctrl_pts_tur[-1], abs_pt_tur]), setpos=False)
-            del ctrl_pts_svg[:]
-            del ctrl_pts_tur[:]
-            ctrl_pts_svg.append(abs_pt_svg)
-            ctrl_pts_tur.append(abs_pt_tur)
-
-        # Output the Bézier curve if possible
-        if mode == 'curve' and len(ctrl_pts_tur) == num_req_pts:
-            bezier_pts = bezier(*ctrl_pts_tur)
-            turtle_traverse(bezier_pts, setpos=False)
-            latest_pt_svg = ctrl_pts_svg[-1]
-            latest_pt_tur = ctrl_pts_tur[-1]
-            del ctrl_pts_svg[:]
-            del ctrl_pts_tur[:]
-            ctrl_pts_svg.append(latest_pt_svg)
-            ctrl_pts_tur.append(latest_pt_tur)
-
-    # Go through two list elements (x- and y-coords) during every iteration
-    for dx, dy in zip(*[iter(clz)] * 2):
-        if dx[0] == 'c':
-            mode, dx = 'curve', dx[1:]
-        elif dx[0] == 'l':
-            mode, dx = 'line', dx[1:]
-        elif dx[0] == 'm':
-            curr_pt_svg = (ctrl_pts_svg[-1][0] + int(dx[1:]), ctrl_pts_svg[-1][1] + int(dy))
-            curr_pt_tur = svg_to_turtle(*curr_pt_svg)
-            turtle_setpos(*curr_pt_tur)
-            prev_move_svg = curr_pt_svg
-            ctrl_pts_svg = [curr_pt_svg]
-            ctrl_pts_tur = [curr_pt_tur]
+    Returns a (ctrl_pts, is_line, subpaths, starts) tuple:
+    - ctrl_pts: N x NUM_REQ_PTS x 2 array of absolute control points, one row per segment
+                (a line is stored as its two endpoints, with the second one repeated as padding)
+    - is_line:  length-N boolean array, True for straight segments
+    - subpaths: length-N array, the index of the subpath (`M` / `m`) to which each segment belongs
+    - starts:   K x 2 array of subpath starting points
+
+    BEZIER_OPTION and STANDARD_PATHS are read from CONFIG.
+    """
+    num_req_pts = bezier_num_pts(config.bezier_option)
+    standard_paths = config.standard_paths
+    # RUNS: one (first index, index step, number of segments, is line, subpath) entry per run of similar segments
+    pts, starts, runs = [], [], []
+    # CTRL_START: index of the first control point of the pending segment; MODE: 'line' or 'curve', once drawing
+    state = {'num_pts': 0, 'ctrl_start': 0, 'mode': None, 'curr': np.zeros(2)}
+
+    def _move(point):
+        starts.append(point)
+        pts.append(point[None, :])
+        state['ctrl_start'], state['num_pts'], state['curr'] = state['num_pts'], state['num_pts'] + 1, point
+
+    def _emit(new_pts, mode):
+        """Appends NEW_PTS (absolute) to the point stream, as the endpoints of lines or as Bézier control points."""
+        if len(new_pts) == 0:
+            return
+        if not starts:
+            _move(state['curr'])
+        first, last = state['num_pts'], state['num_pts'] + len(new_pts) - 1
+        if mode == 'line':
+            runs.append((first - 1, 1, len(new_pts), True, len(starts) - 1))
+            state['ctrl_start'] = last
+        else:
+            num_segs = (last - state['ctrl_start']) // (num_req_pts - 1)
+            runs.append((state['ctrl_start'], num_req_pts - 1, num_segs, False, len(starts) - 1))
+            state['ctrl_start'] += num_segs * (num_req_pts - 1)
+        pts.append(new_pts)
+        state['num_pts'], state['curr'], state['mode'] = last + 1, new_pts[-1], mode
+
+    def _emit_quadratic(ctrl, ends):
+        """Appends quadratic curves with control points CTRL and endpoints ENDS (raised to cubics if need be)."""
+        if num_req_pts == 3:
+            _emit(np.stack([ctrl, ends], axis=1).reshape(-1, 2), 'curve')
+        else:
+            begins = np.vstack([state['curr'], ends[:-1]])
+            _emit(np.stack([begins + (ctrl - begins) * 2 / 3.0, ends + (ctrl - ends) * 2 / 3.0, ends],
+                           axis=1).reshape(-1, 2), 'curve')
+
+    def _relative(args, num_pts):
+        """Returns the absolute points for the relative arguments ARGS (K x 2 * NUM_PTS) of a curve command."""
+        coords = args.reshape(len(args), num_pts, 2)
+        if not standard_paths:
+            return (state['curr'] + np.cumsum(coords.reshape(-1, 2), axis=0)).reshape(coords.shape)
+        begins = state['curr'] + np.vstack([np.zeros(2), np.cumsum(coords[:-1, -1], axis=0)])
+        return begins[:, None, :] + coords
+
+    last_cubic, last_quadratic = None, None  # the last control point of the previous curve (for reflection by S / T)
+    for cmd, args in tokenize_numbers(d):
+        rel, op = cmd.islower(), cmd.upper()
+        curr = state['curr']
+        if op == 'M':
+            if len(args) == 0:
+                continue
+            _move(curr + args[0] if rel else args[0])
+            rest = args[1:]
+            _emit(state['curr'] + np.cumsum(rest, axis=0) if rel else rest, 'line')  # implicit lineto
+        elif op == 'L':
+            _emit(curr + np.cumsum(args, axis=0) if rel else args, 'line')
+        elif op in 'HV':
+            axis = 0 if op == 'H' else 1
+            new_pts = np.repeat(curr[None, :], len(args), axis=0)
+            new_pts[:, axis] = curr[axis] + np.cumsum(args[:, 0]) if rel else args[:, 0]
+            _emit(new_pts, 'line')
+        elif op == 'C':
+            ctrl = _relative(args, 3) if rel else args.reshape(-1, 3, 2)
+            _emit(ctrl.reshape(-1, 2), 'curve')
+            if len(ctrl):
+                last_cubic, last_quadratic = ctrl[-1, 1], None
+                continue
+        elif op == 'S':
+            new_pts = []
+            for c1x, c1y, x, y in args.tolist():
+                begin = new_pts[-1] if new_pts else curr
+                ctrl0 = 2 * begin - last_cubic if last_cubic is not None else begin
+                ctrl1 = begin + (c1x, c1y) if rel else np.array([c1x, c1y])
+                end = (ctrl1 if not standard_paths else begin) + (x, y) if rel else np.array([x, y])
+                new_pts.extend([ctrl0, ctrl1, end])
+                last_cubic = ctrl1
+            _emit(np.array(new_pts).reshape(-1, 2), 'curve')
+            last_quadratic = None
+            continue
+        elif op == 'Q':
+            ctrl = _relative(args, 2) if rel else args.reshape(-1, 2, 2)
+            if len(ctrl):
+                _emit_quadratic(ctrl[:, 0], ctrl[:, 1])
+                last_cubic, last_quadratic = None, ctrl[-1, 0]
+                continue
+        elif op == 'T':
+            ctrl, ends = [], []
+            for x, y in args.tolist():
+                begin = ends[-1] if ends else curr
+                ctrl.append(2 * begin - last_quadratic if last_quadratic is not None else begin)
+                ends.append(begin + (x, y) if rel else np.array([x, y]))
+                last_quadratic = ctrl[-1]
+            if ends:
+                _emit_quadratic(np.array(ctrl), np.array(ends))
+            last_cubic = None
+            continue
+        elif op == 'A':
+            for rx, ry, phi, large_arc, sweep, x, y in args.tolist():
+                begin = state['curr']
+                end = begin + (x, y) if rel else np.array([x, y])
+                ctrl = arc_to_bezier(begin, rx, ry, phi, large_arc, sweep, end, num_req_pts - 1)
+                if ctrl is None:
+                    _emit(end[None, :], 'line')
+                else:
+                    _emit(ctrl, 'curve')
+        elif op == 'Z' and starts:
+            if standard_paths:
+                if np.any(curr != starts[-1]):
+                    _emit(starts[-1][None, :], 'line')
+                state['curr'] = starts[-1]
+            elif state['mode'] is not None:
+                _emit(starts[-1][None, :], state['mode'])
+        last_cubic, last_quadratic = None, None
+
+    if not runs:
+        return np.zeros((0, num_req_pts, 2)), np.zeros(0, dtype=bool), np.zeros(0, dtype=int), np.array(starts).reshape(-1, 2)
+    # Index the control points of every segment at once: a line is (p - 1, p, p, ...), a curve (b, b + 1, b + 2, ...)
+    runs = np.array(runs, dtype=int)
+    counts = runs[:, 2]
+    first, step, _, is_line, subpaths = np.repeat(runs, counts, axis=0).T
+    nth = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+    is_line = is_line.astype(bool)
+    pattern = np.where(is_line[:, None], np.minimum(np.arange(num_req_pts), 1), np.arange(num_req_pts))
+    ctrl_pts = np.concatenate(pts)[(first + step * nth)[:, None] + pattern]
+    return ctrl_pts, is_line, subpaths, np.array(starts)
+
+def segment_samples(ctrl_pts, is_line, config):
+    """Returns (samples, seg_idx): the points to visit along every segment (concatenated in order)
+    and the segment to which each one belongs. Lines are visited at their two endpoints only;
+    curves are sampled every STEP_SIZE in t, or adaptively if FLATTEN_TOLERANCE is set (both read from CONFIG).
+    """
+    if config.flatten_tolerance is not None:
+        num_steps = np.where(is_line, 1, bezier_subdivisions(ctrl_pts, config.flatten_tolerance))
+        endpoint = ctrl_pts.shape[1] == 3 or not config.cubic_unfinished
+        counts = np.where(is_line, 2, num_steps + 1 if endpoint else num_steps)
+        samples, _ = bezier_adaptive(ctrl_pts, num_steps, True)
+        # Drop the final point of unfinished curves (lines always keep theirs)
+        keep = np.ones(len(samples), dtype=bool)
+        keep[np.cumsum(num_steps + 1) - 1] = counts == num_steps + 1
+        return samples[keep], np.repeat(np.arange(len(ctrl_pts)), counts)
+
+    curve_pts = bezier_segments(ctrl_pts, config)
+    width = max(curve_pts.shape[1], 2)
+    all_pts = np.zeros((len(ctrl_pts), width, 2))
+    valid = np.zeros((len(ctrl_pts), width), dtype=bool)
+    all_pts[:, :curve_pts.shape[1]] = curve_pts
+    valid[:, :curve_pts.shape[1]] = True
+    all_pts[is_line, :2] = ctrl_pts[is_line][:, [0, -1]]
+    valid[is_line] = False
+    valid[is_line, :2] = True
+    return all_pts[valid], np.nonzero(valid)[0]
+
+def path_segments(ctx, d):
+    """Tokenizes the path description D (see TOKENIZE_PATH) and maps its points onto turtle coordinates.
+    If CTX.MEMOS is set, the tokens are looked up there before D is tokenized.
+    """
+    if ctx.memos is None:
+        ctrl_svg, is_line, subpaths, starts_svg = tokenize_path(d, ctx.config)
+    else:
+        ctrl_svg, is_line, subpaths, starts_svg = ctx.memos['parse'].lookup(d, lambda d: tokenize_path(d, ctx.config))
+    ctrl_pts = np.stack(ctx.svg_to_turtle(ctrl_svg[..., 0], ctrl_svg[..., 1]), axis=-1)
+    starts = np.stack(ctx.svg_to_turtle(starts_svg[:, 0], starts_svg[:, 1]), axis=-1)
+    return ctrl_pts, is_line, subpaths, starts
+
+def flatten_segments(ctrl_pts, is_line, subpaths, starts, config):
+    """Evaluates every segment returned by PATH_SEGMENTS in one batch, and joins them into a polyline (see PATH_POLYLINE).
+    The curves are sampled as CONFIG says (see SEGMENT_SAMPLES).
+
+    Within a segment, the turtle moves between consecutive curve points (see SEGMENT_SAMPLES). It does not move
+    from the end of one segment to the start of the next; with CUBIC_UNFINISHED, the final step of
+    every curve is skipped and the remainder of the path is drawn from wherever the turtle stopped.
+    """
+    samples, seg_idx = segment_samples(ctrl_pts, is_line, config)
+
+    # Move between consecutive samples, except where one segment ends and the next begins
+    within = seg_idx[1:] == seg_idx[:-1]
+    moves = np.diff(samples, axis=0)[within]
+    owners = subpaths[seg_idx[1:][within]]
+
+    bounds = np.searchsorted(owners, np.arange(len(starts) + 1))
+    offsets = bounds + np.arange(len(starts) + 1)
+    pts = np.empty((offsets[-1], 2))
+    for i, start in enumerate(starts):
+        pts[offsets[i]] = start
+        pts[offsets[i] + 1:offsets[i + 1]] = start + np.cumsum(moves[bounds[i]:bounds[i + 1]], axis=0)
+    return pts, offsets
+
+def path_polyline(ctx, d):
+    """Returns (pts, offsets), where PTS is a contiguous P x 2 array of the points visited by the turtle
+    along the path description D (in absolute turtle coordinates) and subpath i is pts[offsets[i]:offsets[i + 1]].
+    Each subpath begins with a pen-up move to its first point, after which the pen stays down.
+
+    The path goes through three stages: PATH_SEGMENTS, FLATTEN_SEGMENTS and, if CLIP is set,
+    clipping to the canvas (see CLIP_POLYLINE).
+
+    If LOD_PIXELS is set, paths whose control points all fit in a square that many pixels across are not flattened:
+    each becomes a single line along the diagonal of its bounding box instead (or, with LOD_DROP, an empty polyline).
+    They are counted in CTX.NUM_COLLAPSED.
+    """
+    config = ctx.config
+    ctrl_pts, is_line, subpaths, starts = path_segments(ctx, d)
+    pts = None
+    if config.lod_pixels is not None and len(starts) > 0:
+        corners = np.concatenate([ctrl_pts.reshape(-1, 2), starts])
+        lo, hi = corners.min(axis=0), corners.max(axis=0)
+        if np.all(hi - lo < config.lod_pixels):
+            ctx.num_collapsed += 1
+            if config.lod_drop:
+                return np.empty((0, 2)), np.zeros(1, dtype=int)
+            pts, offsets = np.array([lo, hi]), np.array([0, 2])
+    if pts is None:
+        pts, offsets = flatten_segments(ctrl_pts, is_line, subpaths, starts, config)
+    if config.clip:
+        pts, offsets = clip_polyline(pts, offsets, ctx.bounds)
+    return pts, offsets
+
+def draw_path(ctx, pts, offsets):
+    """Draws (or writes the Scheme code for) a path, given its polyline as returned by PATH_POLYLINE."""
+    if ctx.config.fill_shapes:
+        turtle_begin_fill(ctx)
+    for i in range(len(offsets) - 1):
+        turtle_traverse(ctx, pts[offsets[i]:offsets[i + 1]])
+    if ctx.config.fill_shapes:
+        turtle_end_fill(ctx)
+
+############
+# CLIPPING #
+############
+
+def clip_polyline(pts, offsets, bounds):
+    """Clips a polyline (as returned by PATH_POLYLINE) to the rectangle BOUNDS = (min x, min y, max x, max y),
+    using the Liang-Barsky algorithm on every move at once.
+
+    Moves which leave the rectangle are cut short at its edge, and the pen is lifted until the polyline
+    comes back in (so each visible stretch becomes a subpath of its own). Anything entirely outside is dropped.
+    """
+    x_min, y_min, x_max, y_max = bounds
+    if len(pts) == 0:
+        return pts, offsets
+    lo, hi = pts.min(axis=0), pts.max(axis=0)
+    if lo[0] >= x_min and lo[1] >= y_min and hi[0] <= x_max and hi[1] <= y_max:
+        return pts, offsets  # nothing to clip
+
+    sub_idx = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    is_move = np.ones(len(pts), dtype=bool)
+    is_move[offsets[:-1]] = False
+    ends = np.flatnonzero(is_move)
+    a, b = pts[ends - 1], pts[ends]
+    delta = b - a
+
+    # Solve for the range [t0, t1] of each move a + t * (b - a) which lies within all four edges
+    p = np.stack([-delta[:, 0], delta[:, 0], -delta[:, 1], delta[:, 1]], axis=1)
+    q = np.stack([a[:, 0] - x_min, x_max - a[:, 0], a[:, 1] - y_min, y_max - a[:, 1]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = q / p
+    t0 = np.max(np.where(p < 0, ratio, 0), axis=1)
+    t1 = np.min(np.where(p > 0, ratio, 1), axis=1)
+    visible = (t0 <= t1) & ~np.any((p == 0) & (q < 0), axis=1)
+
+    # A visible move continues the previous one if that one ended in bounds, right where this one starts
+    prev_visible = np.concatenate([[False], visible[:-1]])
+    prev_t1 = np.concatenate([[0.0], t1[:-1]])
+    same_sub = np.concatenate([[False], sub_idx[ends[1:]] == sub_idx[ends[:-1]]])
+    new_run = ~(prev_visible & same_sub & (prev_t1 == 1) & (t0 == 0))
+
+    # Emit [clipped start,] clipped end for every visible move, in order
+    clipped_a, clipped_b = a + delta * t0[:, None], a + delta * t1[:, None]
+    vis = np.flatnonzero(visible)
+    starts_run = new_run[vis]
+    num_out = 1 + starts_run.astype(int)
+    out_idx = np.cumsum(num_out) - 1  # position of each clipped end
+    out = np.empty((num_out.sum(), 2))
+    out[out_idx] = clipped_b[vis]
+    out[out_idx[starts_run] - 1] = clipped_a[vis[starts_run]]
+    run_starts = out_idx[starts_run] - 1
+
+    # Keep lone points (subpaths without any moves) if they are in bounds
+    lone = np.flatnonzero(np.diff(offsets) == 1)
+    lone_pts = pts[offsets[lone]]
+    inside = ((lone_pts[:, 0] >= x_min) & (lone_pts[:, 0] <= x_max) &
+              (lone_pts[:, 1] >= y_min) & (lone_pts[:, 1] <= y_max))
+    if np.any(inside):
+        # Interleave them with the runs according to where they appeared in the original polyline
+        order_key = np.concatenate([ends[vis[starts_run]] - 0.5, offsets[lone[inside]]])
+        pieces = [out[run_starts[i]:(run_starts[i + 1] if i + 1 < len(run_starts) else len(out))]
+                  for i in range(len(run_starts))] + [p[None, :] for p in lone_pts[inside]]
+        pieces = [pieces[i] for i in np.argsort(order_key, kind='mergesort')]
+        lengths = np.array([len(piece) for piece in pieces])
+        return np.concatenate(pieces), np.concatenate([[0], np.cumsum(lengths)])
+    return out, np.concatenate([run_starts, [len(out)]]).astype(int)
+
+##################
+# SIMPLIFICATION #
+##################
+
+def _compact(pts, offsets, keep):
+    """Returns the polyline (pts, offsets) restricted to the points where KEEP is True."""
+    sub_idx = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    counts = np.bincount(sub_idx[keep], minlength=len(offsets) - 1)
+    return pts[keep], np.concatenate([[0], np.cumsum(counts)])
+
+def _endpoints(pts, offsets):
+    """Returns a mask of the first and last point of every subpath."""
+    mask = np.zeros(len(pts), dtype=bool)
+    mask[offsets[:-1]] = True
+    mask[offsets[1:] - 1] = True
+    return mask
+
+def drop_zero_moves(pts, offsets):
+    """Removes moves of length zero (never the starting point of a subpath)."""
+    keep = np.ones(len(pts), dtype=bool)
+    keep[1:] = np.any(pts[1:] != pts[:-1], axis=1)
+    keep[offsets[:-1]] = True
+    return _compact(pts, offsets, keep)
+
+def merge_collinear(pts, offsets):
+    """Removes every point at which the heading does not change, merging the moves on either side of it."""
+    if len(pts) < 3:
+        return pts, offsets
+    u, v = pts[1:-1] - pts[:-2], pts[2:] - pts[1:-1]
+    cross = u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+    dot = (u * v).sum(axis=1)
+    scale = np.hypot(u[:, 0], u[:, 1]) * np.hypot(v[:, 0], v[:, 1])
+    keep = np.ones(len(pts), dtype=bool)
+    keep[1:-1] = (np.abs(cross) > 1e-9 * scale) | (dot <= 0)
+    keep |= _endpoints(pts, offsets)
+    return _compact(pts, offsets, keep)
+
+def douglas_peucker(pts, offsets, tolerance):
+    """Ramer-Douglas-Peucker simplification of every subpath at once:
+    keeps only the points needed to stay within TOLERANCE (in turtle coordinates, i.e. pixels) of the original.
+
+    Each round handles all pending (start, end) ranges together, finding the interior point farthest
+    from the segment between the range's endpoints and splitting the range there if it is farther than TOLERANCE.
+    """
+    keep = _endpoints(pts, offsets)
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    while True:
+        pending = ends - starts >= 2
+        starts, ends = starts[pending], ends[pending]
+        if len(starts) == 0:
+            break
+        num_interior = ends - starts - 1
+        firsts = np.cumsum(num_interior) - num_interior
+        range_idx = np.repeat(np.arange(len(starts)), num_interior)
+        interior = starts[range_idx] + 1 + np.arange(len(range_idx)) - firsts[range_idx]
+
+        # Distance from each interior point to the segment between its range's endpoints
+        a, b, p = pts[starts[range_idx]], pts[ends[range_idx]], pts[interior]
+        ab, ap = b - a, p - a
+        ab_sq = (ab * ab).sum(axis=1)
+        t = np.clip((ap * ab).sum(axis=1) / np.where(ab_sq > 0, ab_sq, 1), 0, 1)
+        offset = ap - ab * t[:, None]
+        dist = np.hypot(offset[:, 0], offset[:, 1])
+
+        max_dist = np.maximum.reduceat(dist, firsts)
+        _, first_max = np.unique(range_idx[dist == max_dist[range_idx]], return_index=True)
+        farthest = interior[np.flatnonzero(dist == max_dist[range_idx])[first_max]]
+        split = max_dist > tolerance
+        keep[farthest[split]] = True
+        starts, ends = (np.concatenate([starts[split], farthest[split]]),
+                        np.concatenate([farthest[split], ends[split]]))
+    return _compact(pts, offsets, keep)
+
+def simplify_polyline(pts, offsets, tolerance):
+    """Reduces the number of moves in a polyline (as returned by PATH_POLYLINE) without changing the first point
+    of any subpath. Zero-length moves are dropped and consecutive moves with the same heading are merged;
+    if TOLERANCE > 0, points are also removed as long as the result stays within TOLERANCE pixels of the original.
+    """
+    pts, offsets = drop_zero_moves(pts, offsets)
+    if tolerance > 0:
+        pts, offsets = douglas_peucker(pts, offsets, tolerance)
+    return merge_collinear(pts, offsets)
+
+###############
+# SVG PARSING #
+###############
+
+import mmap
+import collections
+import xml.etree.ElementTree
+from xml.parsers import expat
+
+def local_tag(tag):
+    """Strips the namespace (if any) from an element tag, e.g. '{http://www.w3.org/2000/svg}g' -> 'g'."""
+    return tag.rsplit('}', 1)[-1].strip()
+
+def read_svg_attrib(infile):
+    """Returns the attributes of the root <svg> element, without reading any further into the file."""
+    for _, elem in xml.etree.ElementTree.iterparse(infile, events=('start',)):
+        return dict(elem.attrib)
+
+def view_box(svg_attrib):
+    """Returns the (min x, min y, width, height) of the user coordinate system, given the attributes of the <svg> element:
+    its viewBox (four numbers, separated by whitespace and/or commas), or else 0, 0 and its width and height
+    (in pixels, with or without `px`). Raises ValueError if neither can be read.
+
+    >>> view_box({'viewBox': '0,0, 100 50'})
+    (0.0, 0.0, 100.0, 50.0)
+    >>> view_box({'width': '320px', 'height': '240'})
+    (0.0, 0.0, 320.0, 240.0)
+    """
+    if 'viewBox' in svg_attrib:
+        values = re.split(r'[\s,]+', svg_attrib['viewBox'].strip())
+    else:
+        values = ['0', '0'] + [re.sub(r'px$', '', svg_attrib.get(name, '').strip()) for name in ('width', 'height')]
+    try:
+        box = tuple(float(value) for value in values)
+    except ValueError:
+        box = ()
+    if len(box) != 4 or box[2] <= 0 or box[3] <= 0:
+        raise ValueError('no usable viewBox (or width and height) in %r' % svg_attrib)
+    return box
+
+def iter_paths(infile):
+    """Streams (group index, fill, d) records from the SVG file INFILE in document order.
+    The first record for each <g> group has d = None (so that its color can be set even if it is empty).
+    Elements are discarded as soon as they have been read, so memory use does not grow with the size of the file.
+    """
+    depth, group_idx, group, fill = 0, -1, None, None
+    for event, elem in xml.etree.ElementTree.iterparse(infile, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                group_idx += 1
+                group = elem if local_tag(elem.tag) == 'g' else None
+                if group is not None:
+                    fill = elem.attrib.get('fill', '#000000').upper()
+                    yield group_idx, fill, None
             continue
-        elif dx[0].isalpha():
-            print('WARNING: unrecognized attribute (%s)' % dx[0])
-        if dy[-1] == 'z':
-            close, dy = True, dy[:-1]
-        dx, dy = int(dx), int(dy)
+        depth -= 1
+        if depth == 2 and group is not None:
+            if local_tag(elem.tag) == 'path':
+                yield group_idx, fill, elem.attrib['d']
+            else:
+                print('WARNING: unrecognized element (%s)' % local_tag(elem.tag))
+            group.remove(elem)
+        elif depth == 1:
+            elem.clear()
+
+def index_groups(infile):
+    """Builds a compact index of the <g> groups in INFILE, without holding on to any path data.
+    Returns a list of (fill, offsets) pairs, where OFFSETS is an array containing the byte offset
+    of each <path> element in the group (to be read back later by READ_PATH_DATA).
+    """
+    groups, state = [], {'depth': 0, 'offsets': None}
+    parser = expat.ParserCreate()
+
+    def _start(name, attrs):
+        state['depth'] += 1
+        if state['depth'] == 2 and local_tag(name) == 'g':
+            state['offsets'] = []
+            groups.append((attrs.get('fill', '#000000').upper(), state['offsets']))
+        elif state['depth'] == 3 and state['offsets'] is not None:
+            if local_tag(name) == 'path':
+                state['offsets'].append(parser.CurrentByteIndex)
+            else:
+                print('WARNING: unrecognized element (%s)' % local_tag(name))
 
-        _rel_draw(dx, dy)
-        if close:
-            _rel_draw(prev_move_svg[0] - ctrl_pts_svg[-1][0], prev_move_svg[1] - ctrl_pts_svg[-1][1])
-            close = False
+    def _end(name):
+        if state['depth'] == 2:
+            state['offsets'] = None
+        state['depth'] -= 1
 
-if __name__ == '__main__':
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--scheme', '-s', action='store_true')
-    parser.add_argument('input_file', type=str, help='___.svg')
-    args = parser.parse_args()
-    infile = args.input_file
-    direct_draw = not args.scheme
-
-    import sys
-    python_ver = sys.version_info[0]
-
-    import os
-    OUTFOLDER = 'out'
-    if not os.path.isdir(OUTFOLDER):
-        os.makedirs(OUTFOLDER)
-    infile_base = os.path.basename(infile)
-    if '.' in infile_base:
-        infile_base = infile_base[:infile_base.rfind('.')]
-    if direct_draw:
-        outfile_ext = 'png' if python_ver >= 3 else 'svg'
+    parser.StartElementHandler = _start
+    parser.EndElementHandler = _end
+    with open(infile, 'rb') as f:
+        parser.ParseFile(f)
+    return [(fill, np.array(offsets, dtype=np.int64)) for fill, offsets in groups]
+
+PATH_DATA_RE = re.compile(br'\sd\s*=\s*("[^"]*"|\'[^\']*\')')
+
+def read_path_data(svg_map, offset):
+    """Returns the `d` attribute of the <path> element starting at byte OFFSET of SVG_MAP (an mmap of the file),
+    with any character and entity references (such as `&#10;`) replaced, as the XML parser of ITER_PATHS would.
+    """
+    d = PATH_DATA_RE.search(svg_map, offset, svg_map.find(b'>', offset)).group(1)[1:-1].decode('utf-8')
+    if '&' in d:
+        try:
+            from html import unescape
+        except ImportError:
+            from HTMLParser import HTMLParser  # Python 2
+            unescape = HTMLParser().unescape
+        d = unescape(d)
+    return d
+
+def intersperse_elements(list_of_lists, end_oriented=False, batch_size=1):
+    """Given a list of lists [[x00, x01, x02, ...], [x10, x11, ...], [x20, x21, ...], ...],
+    yields one element from every list IN ORDER until all of the elements have been exhausted:
+    x00, x10, x20, ..., x01, x11, x21, ..., x02, x12, x22, ...
+
+    In other words, traverses a 2D list in column-major order.
+    The sublists do not need to be of uniform length; if a sublist has been exhausted
+    it will simply be passed over when its turn comes.
+
+    To avoid confusion, the 1D list index will be returned as well
+    (specifying from which list the element came).
+
+    With BATCH_SIZE > 1, each list yields up to BATCH_SIZE consecutive elements per turn instead of one
+    (if END_ORIENTED, the batches line up at the end of each list, so only the first batch may be short).
+    """
+    if batch_size > 1:
+        if end_oriented:
+            batches = [[sublst[max(i - batch_size, 0):i] for i in range(len(sublst), 0, -batch_size)][::-1]
+                       for sublst in list_of_lists]
+        else:
+            batches = [[sublst[i:i + batch_size] for i in range(0, len(sublst), batch_size)] for sublst in list_of_lists]
+        for batch, c in intersperse_elements(batches, end_oriented):
+            for x in batch:
+                yield x, c
+        return
+    max_sublist_len = max([len(sublst) for sublst in list_of_lists])
+    len_diffs = [max_sublist_len - len(sublst) for sublst in list_of_lists]
+    for r in range(max_sublist_len):
+        for c in range(len(list_of_lists)):
+            if not end_oriented and r < len(list_of_lists[c]):
+                yield list_of_lists[c][r], c
+            elif end_oriented and 0 <= r - len_diffs[c] < len(list_of_lists[c]):
+                yield list_of_lists[c][r - len_diffs[c]], c
+
+def merge_groups_by_color(groups):
+    """Merges the groups (as returned by INDEX_GROUPS) that share a fill color, keeping their paths in document order."""
+    merged = collections.OrderedDict()
+    for fill, offsets in groups:
+        merged.setdefault(fill, []).append(offsets)
+    return [(fill, np.concatenate(parts)) for fill, parts in merged.items()]
+
+def index_turns(groups, color_batch=None):
+    """Returns the index GROUPS (see INDEX_GROUPS) as the list by which colors take turns when interspersing:
+    one entry per group, or one per color if COLOR_BATCH is set.
+    """
+    return groups if color_batch is None else merge_groups_by_color(groups)
+
+def iter_interspersed_paths(infile, groups, end_oriented=False, color_batch=None):
+    """Streams (group index, fill, d) records from INFILE, interspersing the paths of GROUPS (see INTERSPERSE_ELEMENTS),
+    which is an index of the file as returned by INDEX_TURNS (paths with an offset of -1 are skipped).
+    If COLOR_BATCH is set, the groups of each color (merged by INDEX_TURNS) take turns COLOR_BATCH paths at a time.
+    Only the group index is kept in memory; the path data is read back from the file as needed.
+    """
+    if not groups:
+        return
+    with open(infile, 'rb') as f:
+        svg_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for offset, c in intersperse_elements([offsets for _, offsets in groups], end_oriented, color_batch or 1):
+                if offset < 0:
+                    continue
+                yield c, groups[c][0], read_path_data(svg_map, offset)
+        finally:
+            svg_map.close()
+
+def iter_indexed_paths(infile, groups):
+    """Streams (group index, fill, d) records from INFILE like ITER_PATHS, but for the paths listed in GROUPS
+    (an index of the file as returned by INDEX_GROUPS) instead of all of them, skipping any with an offset of -1.
+    """
+    with open(infile, 'rb') as f:
+        svg_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for group_idx, (fill, offsets) in enumerate(groups):
+                yield group_idx, fill, None
+                for offset in offsets[offsets >= 0].tolist():
+                    yield group_idx, fill, read_path_data(svg_map, offset)
+        finally:
+            svg_map.close()
+
+def simplify_path(ctx, pts, offsets):
+    """Simplifies the polyline PTS / OFFSETS according to SIMPLIFY_TOLERANCE (if set).
+    Keeps count of the moves before and after simplification in CTX.MOVES_BEFORE and CTX.MOVES_AFTER.
+    """
+    if ctx.config.simplify_tolerance is not None:
+        ctx.moves_before += len(pts) - (len(offsets) - 1)
+        pts, offsets = simplify_polyline(pts, offsets, ctx.config.simplify_tolerance)
+        ctx.moves_after += len(pts) - (len(offsets) - 1)
+    return pts, offsets
+
+def compile_path(ctx, d):
+    """Returns the polyline for the path description D (see PATH_POLYLINE), simplified by SIMPLIFY_PATH.
+    If CTX.MEMOS is set, the polyline is looked up there (before and after simplification) before it is computed.
+    """
+    if ctx.memos is None:
+        return simplify_path(ctx, *path_polyline(ctx, d))
+
+    def _flatten(d):
+        return path_polyline(ctx, d)
+
+    def _simplify(d):
+        return simplify_path(ctx, *ctx.memos['flatten'].lookup(d, _flatten))
+
+    return ctx.memos['simplify'].lookup(d, _simplify)
+
+def iter_drawing(ctx):
+    """Streams the drawing in CTX.INFILE as (group index, color, pts, offsets) records, in the order in which they are drawn.
+    COLOR is the color to switch to before drawing the record (or None to keep the current one),
+    and PTS / OFFSETS are the path's polyline as returned by COMPILE_PATH (or None for the start of a group).
+    If REORDER_PATHS is set, the paths of each group are drawn in the order chosen by ITER_ORDERED_DRAWING instead.
+    If ZOOM is set, only the paths that can be seen are read (see INDEX_VISIBLE_GROUPS).
+    """
+    # Potential problem: largest groups still dominate color space
+    END_ORIENTED = True
+    config = ctx.config
+    if config.reorder_paths is not None:
+        for record in iter_ordered_drawing(ctx, END_ORIENTED):
+            yield record
+    elif config.intersperse:
+        groups = index_turns(index_visible_groups(ctx), config.color_batch)
+        for group_idx, color, d in iter_interspersed_paths(ctx.infile, groups, END_ORIENTED, config.color_batch):
+            pts, offsets = compile_path(ctx, d)
+            yield group_idx, color, pts, offsets
     else:
-        outfile_ext = 'scm'
-    outfile = os.path.join(OUTFOLDER, '%s.%s' % (infile_base, outfile_ext))
-
-    if direct_draw:
-        import turtle
-        import tkinter
-        turtle.title('Turtledraw')
-        turtle.mode('logo')
-        screen = turtle.getscreen()
-        window_width = screen.window_width()
-        window_height = screen.window_height()
+        if config.zoom is not None and config.clip:
+            paths = iter_indexed_paths(ctx.infile, index_visible_groups(ctx))
+        else:
+            paths = iter_paths(ctx.infile)
+        for group_idx, color, d in paths:
+            if d is None:
+                yield group_idx, color, None, None
+            else:
+                pts, offsets = compile_path(ctx, d)
+                yield group_idx, None, pts, offsets
+
+#################
+# PATH ORDERING #
+#################
+
+import itertools
+
+REORDER_OPTIONS = (None, 'greedy', '2opt')  # the values of REORDER_PATHS
+TWO_OPT_MAX_SWEEPS = 8
+
+def polyline_ends(pts, offsets):
+    """Returns the points at which the turtle starts and stops drawing a (nonempty) polyline."""
+    return pts[0], pts[offsets[-1] - 1]
+
+def reverse_polyline(pts, offsets):
+    """Returns the polyline (pts, offsets) drawn backwards: the last subpath first, each one from its end to its start."""
+    return pts[::-1], offsets[-1] - offsets[::-1]
+
+def pen_travel(pen, starts, ends):
+    """Returns the total pen-up distance from PEN through paths beginning at STARTS and ending at ENDS, in order."""
+    if len(starts) == 0:
+        return 0.0
+    jumps = starts - np.vstack([pen, ends[:-1]])
+    return float(np.hypot(jumps[:, 0], jumps[:, 1]).sum())
+
+class EndpointGrid(object):
+    """A uniform grid over the endpoints of a group of paths, used to find the closest path that has yet to be drawn.
+    STARTS and ENDS (both D x 2) are where each path begins and ends; if REVERSIBLE, paths may also be entered at their end.
+    """
+
+    def __init__(self, starts, ends, reversible):
+        self.num_paths = len(starts)
+        self.pts = np.concatenate([starts, ends]) if reversible else starts
+        self.lo = self.pts.min(axis=0)
+        extent = self.pts.max(axis=0) - self.lo
+        # Around one endpoint per cell, without letting the number of cells blow up for long thin groups
+        self.cell = max(np.sqrt(extent[0] * extent[1] / len(self.pts)), extent.max() / len(self.pts), 1e-9)
+        self.dims = (extent // self.cell).astype(int) + 1
+        cells = self.cell_of(self.pts)
+        linear = cells[:, 1] * self.dims[0] + cells[:, 0]
+        self.order = np.argsort(linear, kind='mergesort')
+        self.cell_ptr = np.searchsorted(linear[self.order], np.arange(self.dims[0] * self.dims[1] + 1))
+        self.remaining = np.ones(self.num_paths, dtype=bool)
+
+    def cell_of(self, pts):
+        """Returns the (column, row) of the cell containing each of PTS, clamped to the grid."""
+        return np.clip(((pts - self.lo) // self.cell).astype(int), 0, self.dims - 1)
+
+    def pop_nearest(self, pen):
+        """Returns (path index, reversed) for the remaining path whose start (or end, if reversed) is closest to PEN,
+        and removes it from the grid. Searches growing squares of cells around PEN until no closer endpoint can exist
+        (doubling the square while it is empty, then growing it just enough to cover the closest endpoint found so far).
+        """
+        width, height = self.dims.tolist()
+        cx, cy = self.cell_of(pen).tolist()
+        r = 0
+        while True:
+            x0, x1, y0, y1 = max(cx - r, 0), min(cx + r, width - 1), max(cy - r, 0), min(cy + r, height - 1)
+            ids = np.concatenate([self.order[self.cell_ptr[y * width + x0]:self.cell_ptr[y * width + x1 + 1]]
+                                  for y in range(y0, y1 + 1)])
+            ids = ids[self.remaining[ids % self.num_paths]]
+            everywhere = (x0, y0, x1, y1) == (0, 0, width - 1, height - 1)
+            if len(ids) > 0:
+                deltas = self.pts[ids] - pen
+                dists = np.hypot(deltas[:, 0], deltas[:, 1])
+                best = np.argmin(dists)
+                # Every endpoint outside of the square is at least R cells away from PEN
+                if dists[best] <= r * self.cell or everywhere:
+                    path = int(ids[best]) % self.num_paths
+                    self.remaining[path] = False
+                    return path, bool(ids[best] >= self.num_paths)
+                r = max(r + 1, int(np.ceil(dists[best] / self.cell)))
+            else:
+                assert not everywhere, 'no paths left'
+                r = max(r * 2, 1)
+
+def two_opt(pen, order, flipped, starts, ends):
+    """Shortens the pen-up travel through a sequence of paths (entered from PEN) by reversing runs of the sequence.
+    ORDER holds the paths in sequence, FLIPPED marks the ones drawn backwards, and STARTS / ENDS are where each one
+    begins and ends as drawn. All four arrays are updated in place.
+
+    Reversing the run from i to j swaps the jumps into path i and out of path j for a jump into path j (at its end)
+    and a jump out of path i (from its start). For each i, the gains for every j are computed at once.
+    """
+    n = len(order)
+    for _ in range(TWO_OPT_MAX_SWEEPS):
+        improved = False
+        for i in range(n - 1):
+            before = pen if i == 0 else ends[i - 1]
+            old_in = np.hypot(*(starts[i] - before))
+            new_in = np.hypot(*(ends[i:] - before).T)
+            old_out, new_out = np.zeros(n - i), np.zeros(n - i)  # nothing follows the last path
+            old_out[:-1] = np.hypot(*(starts[i + 1:] - ends[i:-1]).T)
+            new_out[:-1] = np.hypot(*(starts[i + 1:] - starts[i]).T)
+            gains = old_in + old_out - new_in - new_out
+            j = i + int(np.argmax(gains))
+            if gains[j - i] > 1e-9:
+                starts[i:j + 1], ends[i:j + 1] = ends[i:j + 1][::-1].copy(), starts[i:j + 1][::-1].copy()
+                order[i:j + 1], flipped[i:j + 1] = order[i:j + 1][::-1].copy(), ~flipped[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+
+def plan_path_order(ctx, groups, end_oriented=False):
+    """Chooses the order in which to draw the paths of GROUPS (as returned by INDEX_GROUPS).
+    Returns a list of (group index, path index, reversed) triples. Paths that were clipped away (or culled) entirely are left out.
+
+    Colors take turns as they normally would (group by group, or as in INTERSPERSE_ELEMENTS if INTERSPERSE is set),
+    but whenever it is a color's turn, the closest of its remaining paths is drawn next (a nearest-neighbor tour).
+    With REORDER_PATHS = '2opt' and REVERSE_PATHS, each run of paths of the same color is then improved by TWO_OPT.
+    The pen-up travel between paths, before and after, is recorded in CTX.TRAVEL_BEFORE and CTX.TRAVEL_AFTER.
+    """
+    config = ctx.config
+    paths, starts, ends = [], [], []  # for the nonempty paths of each group
+    with open(ctx.infile, 'rb') as f:
+        svg_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for _, offsets in groups:
+                group_paths, group_ends = [], []
+                for p, offset in enumerate(offsets.tolist()):
+                    if offset < 0:
+                        continue  # culled (see INDEX_VISIBLE_GROUPS)
+                    pts, sub_offsets = compile_path(ctx, read_path_data(svg_map, offset))
+                    if len(pts) > 0:
+                        group_paths.append(p)
+                        group_ends.append(polyline_ends(pts, sub_offsets))
+                group_ends = np.array(group_ends).reshape(-1, 2, 2)
+                paths.append(group_paths)
+                starts.append(group_ends[:, 0])
+                ends.append(group_ends[:, 1])
+        finally:
+            svg_map.close()
+    ctx.moves_before, ctx.moves_after = 0, 0  # the paths are compiled (and counted) again when they are drawn
+    ctx.num_collapsed = 0
+
+    # The usual drawing order, as (index among the group's nonempty paths, group index) pairs
+    counts = [list(range(len(group_paths))) for group_paths in paths]
+    if config.intersperse and groups:
+        sequence = list(intersperse_elements(counts, end_oriented, config.color_batch or 1))
     else:
-        window_width = DEFAULT_WINDOW_WIDTH
-        window_height = DEFAULT_WINDOW_HEIGHT
-
-    if WINDOW_WIDTH_OVERRIDE is not None:
-        window_width = WINDOW_WIDTH_OVERRIDE
-    if WINDOW_HEIGHT_OVERRIDE is not None:
-        window_height = WINDOW_HEIGHT_OVERRIDE
-
-    import xml.etree.ElementTree
-    svgroot = xml.etree.ElementTree.parse(infile).getroot()
-
-    width = float(svgroot.attrib.get('width', None)[:-2])
-    height = float(svgroot.attrib.get('height', None)[:-2])
-    vb_min_x, vb_min_y, vb_width, vb_height = svgroot.attrib.get('viewBox', None).split()
-    vb_min_x, vb_min_y, vb_width, vb_height = [float(d) for d in (vb_min_x, vb_min_y, vb_width, vb_height)]
-    assert vb_min_x == 0 and vb_min_y == 0, 'viewBox translations are not currently supported ' \
-                                            '(min-x=%r, min-y=%r)' % (vb_min_x, vb_min_y)
-
-    padding = 20
-    canvas_width = window_width - padding * 2
-    canvas_height = window_height - padding * 2
-    canvas_aspect_ratio = canvas_width / canvas_height
-    view_box_aspect_ratio = vb_width / vb_height
-
-    # Compute coordinate transform info
-    if canvas_aspect_ratio == view_box_aspect_ratio:
-        x_scale = float(canvas_width) / vb_width
-        y_scale = float(canvas_height) / vb_height
-    elif view_box_aspect_ratio > 1:
-        x_scale = float(canvas_width) / vb_width
-        y_scale = x_scale
+        sequence = [(i, c) for c in range(len(groups)) for i in counts[c]]
+    home = np.zeros(2)
+    ctx.travel_before = pen_travel(home, np.array([starts[c][i] for i, c in sequence]).reshape(-1, 2),
+                                   np.array([ends[c][i] for i, c in sequence]).reshape(-1, 2))
+
+    grids = [EndpointGrid(starts[c], ends[c], config.reverse_paths) if paths[c] else None for c in range(len(groups))]
+    plan, pen, seq_starts, seq_ends = [], home, [], []
+    for c, run in itertools.groupby([c for _, c in sequence]):
+        entry, order, flipped = pen, [], []
+        for _ in run:
+            i, flip = grids[c].pop_nearest(pen)
+            order.append(i)
+            flipped.append(flip)
+            pen = starts[c][i] if flip else ends[c][i]
+        order, flipped = np.array(order), np.array(flipped)
+        run_starts = np.where(flipped[:, None], ends[c][order], starts[c][order])
+        run_ends = np.where(flipped[:, None], starts[c][order], ends[c][order])
+        if config.reorder_paths == '2opt' and config.reverse_paths and len(order) > 2:
+            two_opt(entry, order, flipped, run_starts, run_ends)
+            pen = run_ends[-1]
+        seq_starts.append(run_starts)
+        seq_ends.append(run_ends)
+        plan.extend((c, paths[c][i], flip) for i, flip in zip(order.tolist(), flipped.tolist()))
+    if plan:
+        ctx.travel_after = pen_travel(home, np.concatenate(seq_starts), np.concatenate(seq_ends))
     else:
-        y_scale = float(canvas_height) / vb_height
-        x_scale = y_scale
-    x_shift, y_shift = -float(canvas_width) / 2, -float(canvas_height) / 2  # translation to apply to all coords
+        ctx.travel_after = 0.0
+    return plan
+
+def iter_ordered_drawing(ctx, end_oriented=False):
+    """Streams the drawing in CTX.INFILE as records (see ITER_DRAWING) in the order chosen by PLAN_PATH_ORDER.
+    Every path is compiled twice: once to find its endpoints, and again (read back from the file) to draw it.
+    """
+    intersperse = ctx.config.intersperse
+    groups = index_visible_groups(ctx)
+    if intersperse:
+        groups = index_turns(groups, ctx.config.color_batch)
+    plan = plan_path_order(ctx, groups, end_oriented)
+    if not intersperse:
+        by_group = [[] for _ in groups]
+        for c, p, flip in plan:
+            by_group[c].append((c, p, flip))
+        plan = [entry for c in range(len(groups)) for entry in [(c, None, False)] + by_group[c]]
+    with open(ctx.infile, 'rb') as f:
+        svg_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for c, p, flip in plan:
+                fill, offsets = groups[c]
+                if p is None:
+                    yield c, fill, None, None
+                    continue
+                pts, sub_offsets = compile_path(ctx, read_path_data(svg_map, offsets[p]))
+                if flip:
+                    pts, sub_offsets = reverse_polyline(pts, sub_offsets)
+                yield c, fill if intersperse else None, pts, sub_offsets
+        finally:
+            svg_map.close()
+
+##############
+# PATH CACHE #
+##############
+
+import os
+import hashlib
+
+CACHE_VERSION = 2
+
+_temp_ids = itertools.count()
+
+def temp_path(path):
+    """Returns the name of a temporary file to write PATH to (and then rename), unique to this call,
+    so that threads and processes writing the same file at once never write to the same temporary file.
+    """
+    return '%s.%d-%d.tmp' % (path, os.getpid(), next(_temp_ids))
+
+def ensure_dir(path):
+    """Creates the directory PATH, unless it exists already (or another thread or process creates it meanwhile)."""
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+def cache_key(infile, *params):
+    """Returns a key identifying the contents of INFILE together with PARAMS (everything else the polylines depend on)."""
+    h = hashlib.sha1()
+    with open(infile, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    h.update(repr((CACHE_VERSION,) + params).encode('utf-8'))
+    return h.hexdigest()
+
+def cache_path(cache_dir, key, ext=None):
+    """Returns the filename of the entry for KEY in the cache CACHE_DIR (a drawing file, unless given another extension EXT)."""
+    return os.path.join(cache_dir, key + (DRAWING_EXT if ext is None else ext))
+
+def load_cached_drawing(cache_dir, key):
+    """Returns the drawing cached in CACHE_DIR under KEY as a stream of records (see ITER_DRAWING), or None if it isn't cached.
+    The points are memory-mapped rather than read into memory.
+    """
+    path = cache_path(cache_dir, key)
+    if not os.path.isfile(path):
+        return None
+    os.utime(path, None)  # mark as recently used
+    return read_drawing(path)
+
+def cache_drawing(drawing, key, ctx):
+    """Passes the records of DRAWING through unchanged, saving them in the cache (CTX.CONFIG.CACHE_DIR) under KEY along the way
+    (as a drawing file with full-precision points, so that cached output is identical to a fresh conversion).
+    """
+    cache_dir = ctx.config.CACHE_DIR
+    ensure_dir(cache_dir)
+    for record in write_drawing(drawing, cache_path(cache_dir, key), ctx, np.float64):
+        yield record
+    evict_cache(cache_dir, ctx.config.CACHE_MAX_BYTES)
+
+def evict_cache(cache_dir, max_bytes):
+    """Deletes the least recently used entries of the cache CACHE_DIR until it takes up no more than MAX_BYTES.
+    Anything else found in CACHE_DIR (such as entries from older versions) counts as an entry too.
+    """
+    entries = []
+    for filename in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, filename)
+        try:
+            if os.path.isfile(path):
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except OSError:
+            pass  # evicted (or renamed) by another thread or process meanwhile
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # already evicted (e.g. by another thread or process)
+        total -= size
+
+#################
+# SPATIAL INDEX #
+#################
+
+VIEW_MARGIN = 2  # pixels beyond the edge of the view within which paths still count as visible
+
+class BBoxGrid(object):
+    """Finds which of a set of axis-aligned boxes overlap a given rectangle, without looking at every box.
+    BOXES is an N x 4 array of (min x, min y, max x, max y) rows; rows containing NaN never overlap anything.
+
+    The boxes' extent is divided into a uniform grid of about sqrt(N) x sqrt(N) cells, and every box is listed
+    under each cell that it overlaps (CELL_IDS[CELL_STARTS[c]:CELL_STARTS[c + 1]] for cell c), so a query only
+    looks at the boxes listed under the cells that the rectangle covers. Boxes spanning more than MAX_CELLS cells
+    are listed in LARGE instead and checked by every query, which keeps the grid from growing with their size.
+    """
+
+    MAX_CELLS = 16
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        ids = np.nonzero(~np.isnan(boxes).any(axis=1))[0]
+        self.size = size = max(int(np.sqrt(len(ids))), 1)
+        if len(ids) > 0:
+            self.origin = boxes[ids, :2].min(axis=0)
+            self.cell_size = np.maximum((boxes[ids, 2:].max(axis=0) - self.origin) / size, 1e-9)
+        else:
+            self.origin, self.cell_size = np.zeros(2), np.ones(2)
+
+        first, last = self.cell_of(boxes[ids, :2]), self.cell_of(boxes[ids, 2:])
+        spans = last - first + 1
+        num_cells = spans[:, 0] * spans[:, 1]
+        large = num_cells > self.MAX_CELLS
+        self.large = ids[large]
+        ids, first, spans, num_cells = ids[~large], first[~large], spans[~large], num_cells[~large]
+
+        # One entry per (box, cell) pair, sorted by cell
+        owners = np.repeat(np.arange(len(ids)), num_cells)
+        nth = np.arange(len(owners)) - np.repeat(np.cumsum(num_cells) - num_cells, num_cells)
+        cells = (first[owners, 1] + nth // spans[owners, 0]) * size + first[owners, 0] + nth % spans[owners, 0]
+        order = np.argsort(cells, kind='mergesort')
+        self.cell_ids = ids[owners[order]]
+        self.cell_starts = np.searchsorted(cells[order], np.arange(size * size + 1))
+
+    def cell_of(self, pts):
+        """Returns the (column, row) of the cell containing each of PTS (points outside the grid go to its edge)."""
+        return np.clip(((pts - self.origin) // self.cell_size).astype(np.int64), 0, self.size - 1)
+
+    def query(self, rect):
+        """Returns a boolean mask of the boxes which overlap RECT = (min x, min y, max x, max y), edges included."""
+        (x0, y0), (x1, y1) = self.cell_of(np.array([rect[:2], rect[2:]], dtype=float))
+        rows = [self.cell_ids[self.cell_starts[row * self.size + x0]:self.cell_starts[row * self.size + x1 + 1]]
+                for row in range(y0, y1 + 1)]
+        candidates = np.concatenate([self.large] + rows)
+        boxes = self.boxes[candidates]
+        overlap = (boxes[:, 0] <= rect[2]) & (boxes[:, 2] >= rect[0]) & (boxes[:, 1] <= rect[3]) & (boxes[:, 3] >= rect[1])
+        mask = np.zeros(len(self.boxes), dtype=bool)
+        mask[candidates[overlap]] = True
+        return mask
+
+def path_bboxes(infile, groups, config, scale=(1.0, 1.0)):
+    """Returns the bounding box (in SVG coordinates) of everything that the turtle draws along each path in GROUPS
+    (an index of INFILE as returned by INDEX_GROUPS), as an N x 4 array of (min x, min y, max x, max y) rows
+    in index order. Paths that draw nothing get a row of NaN.
+
+    The paths are flattened as they would be for drawing (so the boxes include any drift from CUBIC_UNFINISHED),
+    but without clipping. Flattening commutes with scaling, except for how finely FLATTEN_TOLERANCE samples a curve,
+    so the points are multiplied by SCALE (the number of pixels per SVG unit) while they are flattened.
+    The paths are read and flattened with the parameters in CONFIG.
+    """
+    scale = np.asarray(scale, dtype=float)
+    boxes = np.full((sum(len(offsets) for _, offsets in groups), 4), np.nan)
+    i = 0
+    with open(infile, 'rb') as f:
+        svg_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for _, offsets in groups:
+                for offset in offsets.tolist():
+                    ctrl_pts, is_line, subpaths, starts = tokenize_path(read_path_data(svg_map, offset), config)
+                    pts, _ = flatten_segments(ctrl_pts * scale, is_line, subpaths, starts * scale, config)
+                    if len(pts) > 0:
+                        boxes[i] = np.concatenate([pts.min(axis=0), pts.max(axis=0)]) / np.tile(scale, 2)
+                    i += 1
+        finally:
+            svg_map.close()
+    return boxes
+
+def load_path_bboxes(ctx, groups):
+    """Returns PATH_BBOXES for the paths of CTX.INFILE listed in GROUPS (the file's full index, from INDEX_GROUPS),
+    from the cache if possible. They depend on the window size only through FLATTEN_TOLERANCE,
+    so one cache entry serves every ZOOM unless that is set.
+    """
+    config = ctx.config
+    scale = (1.0, 1.0) if config.flatten_tolerance is None else (ctx.x_scale, ctx.y_scale)
+    if config.CACHE_DIR is None:
+        return path_bboxes(ctx.infile, groups, config, scale)
+    path = cache_path(config.CACHE_DIR, cache_key(ctx.infile, 'bboxes', config.step_size, config.flatten_tolerance,
+                                                  config.bezier_option, config.cubic_unfinished, config.standard_paths,
+                                                  scale), '.npy')
+    if os.path.isfile(path):
+        os.utime(path, None)  # mark as recently used
+        return np.load(path)
+    boxes = path_bboxes(ctx.infile, groups, config, scale)
+    ensure_dir(config.CACHE_DIR)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as out:
+        np.save(out, boxes)
+    os.rename(tmp_path, path)
+    evict_cache(config.CACHE_DIR, config.CACHE_MAX_BYTES)
+    return boxes
+
+def index_visible_groups(ctx):
+    """Returns the index of CTX.INFILE (see INDEX_GROUPS). If ZOOM is set (along with CLIP), paths which lie
+    entirely outside of the view have their offset replaced by -1, so that they are never read or flattened;
+    they are found through a BBOXGRID over LOAD_PATH_BBOXES, and counted in CTX.NUM_CULLED. (They are not removed,
+    so that the remaining paths are still drawn in the same order as they would be in the whole drawing.)
+    """
+    groups = index_groups(ctx.infile)
+    if ctx.config.zoom is None or not ctx.config.clip:
+        return groups
+    margin = VIEW_MARGIN / min(ctx.x_scale, ctx.y_scale)
+    min_x, min_y, max_x, max_y = ctx.view
+    visible = BBoxGrid(load_path_bboxes(ctx, groups)).query((min_x - margin, min_y - margin, max_x + margin, max_y + margin))
+    ctx.num_culled = int(len(visible) - visible.sum())
+    ends = np.cumsum([len(offsets) for _, offsets in groups], dtype=np.int64)
+    return [(fill, np.where(mask, offsets, -1)) for (fill, offsets), mask in zip(groups, np.split(visible, ends[:-1]))]
+
+#################
+# DRAWING FILES #
+#################
+
+DRAWING_EXT = '.tdraw'
+DRAWING_MAGIC = b'TURTLEDR'
+DRAWING_VERSION = 1
+DRAWING_HEADER_FIELDS = ('magic', 'version', 'point_bytes', 'window_width', 'window_height',
+                         'vb_width', 'vb_height', 'canvas_width', 'canvas_height', 'x_scale', 'y_scale', 'x_shift', 'y_shift',
+                         'num_points', 'num_subpaths', 'num_records', 'num_colors', 'subpaths_at', 'records_at', 'colors_at')
+DRAWING_HEADER = struct.Struct('<8sIIII8d7Q')
+DRAWING_POINTS_AT = 256
+DRAWING_RECORD = np.dtype([('group', '<i4'), ('color', '<i4'), ('first_subpath', '<i8'), ('num_subpaths', '<i8')])
+DRAWING_COLOR = np.dtype('S16')
+
+def is_drawing_file(path):
+    """True if PATH names a drawing file (by its extension)."""
+    return os.path.splitext(path)[1] == DRAWING_EXT
+
+def write_drawing(drawing, path, ctx, point_dtype=np.float32):
+    """Passes the records of DRAWING (see ITER_DRAWING) through unchanged, writing them to the drawing file PATH
+    along the way, with the coordinate transform of CTX and points of type POINT_DTYPE (float32 or float64).
+    Points are appended to the file as they arrive; PATH only appears once the whole drawing has been seen.
+    """
+    tmp_path = temp_path(path)
+    colors, records, subpaths, num_subpaths, num_points = [], [], [], 0, 0
+    with open(tmp_path, 'wb') as out:
+        out.write(b'\0' * DRAWING_POINTS_AT)
+        for group_idx, color, pts, offsets in drawing:
+            if color is not None and color not in colors:
+                colors.append(color)
+            color_idx = -1 if color is None else colors.index(color)
+            if pts is None:
+                records.append((group_idx, color_idx, -1, -1))
+            else:
+                records.append((group_idx, color_idx, num_subpaths, len(offsets) - 1))
+                subpaths.append(np.asarray(offsets[:-1]) + num_points)
+                num_subpaths += len(offsets) - 1
+                np.ascontiguousarray(pts, dtype=point_dtype).tofile(out)
+                num_points += len(pts)
+            yield group_idx, color, pts, offsets
+
+        subpaths.append([num_points])
+        sections = [np.concatenate(subpaths).astype('<u8'), np.array(records, dtype=DRAWING_RECORD),
+                    np.array([color.encode('ascii') for color in colors], dtype=DRAWING_COLOR)]
+        section_at = []
+        for section in sections:
+            section_at.append(out.tell())
+            section.tofile(out)
+        out.seek(0)
+        out.write(DRAWING_HEADER.pack(DRAWING_MAGIC, DRAWING_VERSION, np.dtype(point_dtype).itemsize,
+                                      ctx.window_width, ctx.window_height, ctx.vb_width, ctx.vb_height,
+                                      ctx.canvas_width, ctx.canvas_height, ctx.x_scale, ctx.y_scale, ctx.x_shift, ctx.y_shift,
+                                      num_points, num_subpaths, len(records), len(colors), *section_at))
+    os.rename(tmp_path, path)
+
+def read_drawing_header(path):
+    """Returns the header of the drawing file PATH as a dictionary (with the keys in DRAWING_HEADER_FIELDS)."""
+    with open(path, 'rb') as f:
+        data = f.read(DRAWING_HEADER.size)
+    if len(data) < DRAWING_HEADER.size or not data.startswith(DRAWING_MAGIC):
+        raise ValueError('%s is not a drawing file' % path)
+    header = dict(zip(DRAWING_HEADER_FIELDS, DRAWING_HEADER.unpack(data)))
+    if header['version'] != DRAWING_VERSION:
+        raise ValueError('%s is a version %d drawing file (expected version %d)' % (path, header['version'], DRAWING_VERSION))
+    return header
+
+def read_drawing(path):
+    """Streams the records (see ITER_DRAWING) stored in the drawing file PATH.
+    Nothing is parsed or copied: the tables and points are memory-mapped, and each record's points are a view into the file.
+    """
+    header = read_drawing_header(path)
+
+    def _section(dtype, offset, count):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+    pts = _section('<f%d' % header['point_bytes'], DRAWING_POINTS_AT, 2 * header['num_points']).reshape(-1, 2)
+    subpaths = _section('<u8', header['subpaths_at'], header['num_subpaths'] + 1)
+    records = _section(DRAWING_RECORD, header['records_at'], header['num_records'])
+    colors = [color.decode('ascii') for color in _section(DRAWING_COLOR, header['colors_at'], header['num_colors']).tolist()]
+
+    def _replay():
+        for group_idx, c, first, num_subpaths in records.tolist():
+            color = colors[c] if c >= 0 else None
+            if num_subpaths < 0:
+                yield group_idx, color, None, None
+            else:
+                offsets = subpaths[first:first + num_subpaths + 1].astype(np.int64)
+                yield group_idx, color, pts[offsets[0]:offsets[-1]], offsets - offsets[0]
+
+    return _replay()
+
+##############
+# CONVERSION #
+##############
+
+import sys
+import time
+import functools
+
+OUTFOLDER = 'out'
+
+BACKENDS = ('turtle', 'scheme', 'raster', 'drawing')
 
-    def svg_to_turtle(x, y):
+class Context(object):
+    """Per-file state: the input and output files, and how SVG coordinates map onto the turtle canvas.
+    BACKEND is one of BACKENDS. With 'turtle', drawing happens through the turtle module TURTLE
+    (or, with BULK_CANVAS, straight onto its canvas through RENDERER, a CanvasRenderer created by DRAW);
+    with 'scheme', Scheme code is written through SCHEME_OUT (a SchemeEmitter, opened by DRAW);
+    with 'raster', an image is drawn by RENDERER (a Rasterizer, also created by DRAW) and saved as a PNG;
+    and with 'drawing', the compiled paths are saved as a drawing file (see WRITE_DRAWING).
+    CONFIG (a Config) holds the parameters that every stage of the conversion reads.
+
+    A DRAWINGSESSION may keep the compiled drawing around between renders, through MEMOS (a dict from stage name
+    to PATHMEMO; see COMPILE_PATH) and RECORDS (a list of the records of ITER_DRAWING, which OPEN_DRAWING then returns).
+
+    INFILE may also be a drawing file, in which case the coordinate transform (and window size) is the one it was
+    converted with, and its paths are drawn as they are. Otherwise, if ZOOM is set, it takes the place of the viewBox,
+    and VIEW is the (min x, min y, max x, max y) rectangle of SVG coordinates that fills the canvas.
+    """
+
+    def __init__(self, infile, backend, window_width, window_height, turtle=None, config=None):
+        assert backend in BACKENDS, 'unknown backend (%s)' % backend
+        self.infile, self.backend, self.turtle = infile, backend, turtle
+        self.config = config = Config() if config is None else config
+        self.direct_draw = backend == 'turtle'
+        self.scheme_out, self.renderer = None, None
+        self.moves_before, self.moves_after = 0, 0
+        self.travel_before, self.travel_after = None, None
+        self.num_culled, self.num_collapsed = 0, 0
+        self.memos, self.records = None, None
+        self.pen = PenState()
+
+        infile_base = os.path.basename(infile)
+        if '.' in infile_base:
+            infile_base = infile_base[:infile_base.rfind('.')]
+        if backend == 'turtle':
+            outfile_ext = 'png' if sys.version_info[0] >= 3 else 'svg'
+        elif backend == 'raster':
+            outfile_ext = 'png'
+        elif backend == 'drawing':
+            outfile_ext = DRAWING_EXT[1:]
+        else:
+            outfile_ext = 'scm'
+        self.outfile = os.path.join(config.OUTFOLDER, '%s.%s' % (infile_base, outfile_ext))
+
+        if is_drawing_file(infile):
+            header = read_drawing_header(infile)
+            self.vb_width, self.vb_height = vb_width, vb_height = header['vb_width'], header['vb_height']
+            self.window_width, self.window_height = header['window_width'], header['window_height']
+            self.canvas_width, self.canvas_height = header['canvas_width'], header['canvas_height']
+            self.x_scale, self.y_scale = header['x_scale'], header['y_scale']
+            self.x_shift, self.y_shift = header['x_shift'], header['y_shift']
+            vb_min_x = (-float(self.canvas_width) / 2 - self.x_shift) / self.x_scale
+            vb_min_y = (self.y_shift + float(self.canvas_height) / 2) / self.y_scale
+        else:
+            vb_min_x, vb_min_y, vb_width, vb_height = view_box(read_svg_attrib(infile))
+            if config.zoom is not None:
+                vb_min_x, vb_min_y, vb_width, vb_height = [float(d) for d in config.zoom]
+            self.vb_width, self.vb_height = vb_width, vb_height
+
+            padding = 20
+            self.window_width, self.window_height = window_width, window_height
+            self.canvas_width = canvas_width = window_width - padding * 2
+            self.canvas_height = canvas_height = window_height - padding * 2
+            canvas_aspect_ratio = canvas_width / canvas_height
+            view_box_aspect_ratio = vb_width / vb_height
+
+            # Compute coordinate transform info
+            if canvas_aspect_ratio == view_box_aspect_ratio:
+                self.x_scale = float(canvas_width) / vb_width
+                self.y_scale = float(canvas_height) / vb_height
+            elif view_box_aspect_ratio > 1:
+                self.x_scale = float(canvas_width) / vb_width
+                self.y_scale = self.x_scale
+            else:
+                self.y_scale = float(canvas_height) / vb_height
+                self.x_scale = self.y_scale
+            # Translation to apply to all coords (putting the viewBox's min-x, min-y at the top left corner)
+            self.x_shift = -float(canvas_width) / 2 - vb_min_x * self.x_scale
+            self.y_shift = -float(canvas_height) / 2 + vb_min_y * self.y_scale
+
+        # Boundary calculations
+        self.vb_min_x, self.vb_min_y = vb_min_x, vb_min_y
+        self.view = (vb_min_x, vb_min_y, vb_min_x + vb_width, vb_min_y + vb_height)
+        self.turtle_00 = self.svg_to_turtle(vb_min_x, vb_min_y)
+        self.turtle_w0 = self.svg_to_turtle(vb_min_x + vb_width, vb_min_y)
+        self.turtle_wh = self.svg_to_turtle(vb_min_x + vb_width, vb_min_y + vb_height)
+        self.turtle_0h = self.svg_to_turtle(vb_min_x, vb_min_y + vb_height)
+        self.bounds = (self.turtle_00[0], self.turtle_0h[1], self.turtle_w0[0], self.turtle_00[1])
+
+    def svg_to_turtle(self, x, y):
         """Transform (absolute) coordinates in SVG system to (absolute) coordinates in turtle system."""
-        return x * x_scale + x_shift, canvas_height - y * y_scale + y_shift
-
-    # Boundary calculations
-    turtle_00 = svg_to_turtle(0, 0)
-    turtle_w0 = svg_to_turtle(vb_width, 0)
-    turtle_wh = svg_to_turtle(vb_width, vb_height)
-    turtle_0h = svg_to_turtle(0, vb_height)
-
-    def svg_oob(x, y):
-        """True if (x, y) is out-of-bounds in SVG coordinates."""
-        return x < 0 or x > vb_width or y < 0 or y > vb_height
-
-    def turtle_oob(x, y):
-        """True if (x, y) is out-of-bounds in turtle coordinates."""
-        return x < turtle_00[0] or x > turtle_w0[0] or y < turtle_0h[1] or y > turtle_00[1]
-
-    def svg_clip(x, y):
-        """Clip (x, y) such that it is in-bounds according to SVG coordinates."""
-        return np.clip(x, 0, vb_width), np.clip(y, 0, vb_height)
-
-    def turtle_clip(x, y):
-        """Clip (x, y) such that it is in-bounds according to turtle coordinates."""
-        return np.clip(x, turtle_00[0], turtle_w0[0]), np.clip(y, turtle_0h[1], turtle_00[1])
-
-    # Overwrite the output file
-    turtle_speed(0, overwrite=True)
-    if pen_width is not None:
-        turtle_pensize(pen_width)
-
-    if direct_draw and not animation:
-        turtle.tracer(0, 0)
-    if draw_boundary:
-        turtle_traverse([turtle_00, turtle_w0, turtle_wh, turtle_0h, turtle_00])
-
-    def intersperse_elements(list_of_lists, end_oriented=False):
-        """Given a list of lists [[x00, x01, x02, ...], [x10, x11, ...], [x20, x21, ...], ...],
-        yields one element from every list IN ORDER until all of the elements have been exhausted:
-        x00, x10, x20, ..., x01, x11, x21, ..., x02, x12, x22, ...
-
-        In other words, traverses a 2D list in column-major order.
-        The sublists do not need to be of uniform length; if a sublist has been exhausted
-        it will simply be passed over when its turn comes.
-
-        To avoid confusion, the 1D list index will be returned as well
-        (specifying from which list the element came).
-        """
-        max_sublist_len = max([len(sublst) for sublst in list_of_lists])
-        len_diffs = [max_sublist_len - len(sublst) for sublst in list_of_lists]
-        for r in range(max_sublist_len):
-            for c in range(len(list_of_lists)):
-                if not end_oriented and r < len(list_of_lists[c]):
-                    yield list_of_lists[c][r], c
-                elif end_oriented and 0 <= r - len_diffs[c] < len(list_of_lists[c]):
-                    yield list_of_lists[c][r - len_diffs[c]], c
-
-    def color_group(g):
-        """Sets turtle color according to the 'fill' attribute of the group G.
-        Returns True upon success, and False upon failure.
-        """
-        if g.tag.rstrip()[-1] != 'g':
-            return False
-        color = g.attrib.get('fill', '#000000').upper()
-        turtle_color(color)
-        return True
-
-    def handle_path(path):
-        """Draws the path specified by PATH.
-        Returns True upon success, and False upon failure.
-        """
-        if path.tag.rstrip()[-4:] != 'path':
-            print('WARNING: unrecognized element (%s)' % path.tag.rstrip())
-            return False
-        d = path.attrib['d'].split()
-        Mx, My, clz = int(d[0][1:]), int(d[1]), d[2:]
-        if fill_shapes:
-            turtle_begin_fill()
-        parse_path(Mx, My, clz)
-        if fill_shapes:
-            turtle_end_fill()
-        return True
+        return x * self.x_scale + self.x_shift, self.canvas_height - y * self.y_scale + self.y_shift
+
+def window_size(config, screen=None):
+    """Returns the (width, height) of the turtle window, taken from SCREEN if drawing directly.
+    The WINDOW_{WIDTH, HEIGHT}_OVERRIDE parameters of CONFIG take precedence.
+    """
+    if screen is not None:
+        window_width, window_height = screen.window_width(), screen.window_height()
+    else:
+        window_width, window_height = config.DEFAULT_WINDOW_WIDTH, config.DEFAULT_WINDOW_HEIGHT
+    if config.WINDOW_WIDTH_OVERRIDE is not None:
+        window_width = config.WINDOW_WIDTH_OVERRIDE
+    if config.WINDOW_HEIGHT_OVERRIDE is not None:
+        window_height = config.WINDOW_HEIGHT_OVERRIDE
+    return window_width, window_height
+
+class FrameScheduler(object):
+    """Decides when to update the screen while drawing without animation, aiming for FPS updates per second.
+    TICK is called after every path; the paths drawn since the last update form a batch, which ends once it has used up
+    its share of the frame and UPDATE is called. Each batch gets whatever is left of a frame after the time the last
+    update took, but never less than WORK_SHARE / (1 - WORK_SHARE) times that: as the canvas fills up and updates
+    get slower, frames are stretched rather than letting updates take over, so that the drawing still finishes.
+    """
+
+    WORK_SHARE = 0.75
+
+    def __init__(self, update, fps):
+        self.update, self.frame_time = update, 1.0 / fps
+        self.frames, self.paths, self.start = 0, 0, time.time()
+        self.deadline = self.start + self.frame_time
+
+    def tick(self):
+        self.paths += 1
+        now = time.time()
+        if now < self.deadline:
+            return
+        self.update()
+        done = time.time()
+        update_time = done - now
+        self.frames += 1
+        self.deadline = done + max(self.frame_time - update_time, update_time * self.WORK_SHARE / (1 - self.WORK_SHARE))
+
+    def report(self, infile):
+        elapsed = time.time() - self.start
+        print('[+] Drew %s in %.2fs: %d updates (%.1f per second, %.0f paths each).' % (infile, elapsed, self.frames,
+              self.frames / max(elapsed, 1e-9), self.paths / max(self.frames, 1)))
+
+def open_drawing(ctx):
+    """Returns the records of the drawing in CTX.INFILE (see ITER_DRAWING), from the cache if possible."""
+    if ctx.records is not None:
+        return iter(ctx.records)
+    if is_drawing_file(ctx.infile):
+        return read_drawing(ctx.infile)
+    config = ctx.config
+    if config.CACHE_DIR is not None:
+        key = cache_key(ctx.infile, config.step_size, config.flatten_tolerance, config.bezier_option, config.cubic_unfinished,
+                        config.standard_paths, config.clip, config.intersperse, config.simplify_tolerance,
+                        config.reorder_paths, config.reverse_paths, config.color_batch, config.zoom, config.lod_pixels,
+                        config.lod_drop, ctx.window_width, ctx.window_height)
+        drawing = load_cached_drawing(config.CACHE_DIR, key)
+        if drawing is not None:
+            print('[+] Using cached paths for %s.' % ctx.infile)
+            return drawing
+        return cache_drawing(iter_drawing(ctx), key, ctx)
+    return iter_drawing(ctx)
+
+def sketch_drawing(ctx, scheduler=None):
+    """Quickly draws a rough version of the drawing in CTX.INFILE onto the canvas, to be replaced by the real thing:
+    every path is simplified to within NO_ANIM_SKETCH pixels, and paths smaller than that are left out.
+    The sketch is tagged with CanvasRenderer.SKETCH_TAG. Calls SCHEDULER.TICK (if given) after every path.
+    If CACHE_DIR is set, this is also the pass that compiles (and caches) the paths, so the full pass only replays them.
+    """
+    tolerance = ctx.config.NO_ANIM_SKETCH
+    ctx.renderer.tags = (CanvasRenderer.TAG, CanvasRenderer.SKETCH_TAG)
+    for _, color, pts, offsets in open_drawing(ctx):
+        if color is not None:
+            turtle_color(ctx, color)
+        if pts is None or len(pts) == 0 or np.hypot(*np.ptp(pts, axis=0)) < tolerance:
+            continue
+        draw_path(ctx, *simplify_polyline(pts, offsets, tolerance))
+        if scheduler is not None:
+            scheduler.tick()
+    ctx.renderer.tags = (CanvasRenderer.TAG,)
+    ctx.moves_before, ctx.moves_after = 0, 0  # counted again by the full pass
+    ctx.num_collapsed = 0
+
+def print_stats(ctx):
+    """Reports on the optional stages that CTX.INFILE went through (if any) while being compiled."""
+    if ctx.moves_before > 0:
+        print('[+] Simplified %s: %d -> %d moves (%.1f%% fewer).' % (ctx.infile, ctx.moves_before, ctx.moves_after,
+              100.0 * (ctx.moves_before - ctx.moves_after) / ctx.moves_before))
+
+    if ctx.travel_before is not None:
+        print('[+] Reordered paths in %s: %.0f -> %.0f pixels of pen-up travel (%.1f%% less).' % (ctx.infile,
+              ctx.travel_before, ctx.travel_after, 100.0 * (ctx.travel_before - ctx.travel_after) / max(ctx.travel_before, 1e-9)))
+
+    if ctx.num_culled > 0:
+        print('[+] Zoomed in on %s: skipped %d paths outside the view.' % (ctx.infile, ctx.num_culled))
+
+    if ctx.num_collapsed > 0:
+        print('[+] %s %d paths in %s that were under %g pixels across.' % ('Dropped' if ctx.config.lod_drop else 'Collapsed',
+              ctx.num_collapsed, ctx.infile, ctx.config.lod_pixels))
+
+def draw(ctx):
+    """Draws the SVG (or drawing) file CTX.INFILE, or writes the corresponding Scheme code, image or drawing file to CTX.OUTFILE.
+    Returns a (number of paths, number of points) tuple.
+    """
+    config = ctx.config
+    if ctx.backend == 'drawing':
+        num_paths, num_points = 0, 0
+        for _, _, pts, _ in write_drawing(open_drawing(ctx), ctx.outfile, ctx):
+            if pts is not None:
+                num_paths += 1
+                num_points += len(pts)
+        print_stats(ctx)
+        return num_paths, num_points
+
+    if ctx.backend == 'scheme':
+        ctx.scheme_out = SchemeEmitter(ctx.outfile, config.SCHEME_FLUSH_SIZE, config.SCHEME_COMPACT,
+                                       config.SCHEME_PRECISION, config.SCHEME_LIST_SIZE)
+    elif ctx.backend == 'raster':
+        ctx.renderer = Rasterizer(ctx.window_width, ctx.window_height)
+    elif config.bulk_canvas and not config.animation:
+        ctx.renderer = CanvasRenderer(ctx.turtle.getscreen())
+    turtle_speed(ctx, 0)
+    if config.pen_width is not None:
+        turtle_pensize(ctx, config.pen_width)
+
+    scheduler = None
+    if ctx.direct_draw and not config.animation:
+        ctx.turtle.tracer(0, 0)
+        if config.NO_ANIM_UPDATE == 'time':
+            scheduler = FrameScheduler(ctx.turtle.update, config.NO_ANIM_FPS)
+    if config.draw_boundary:
+        turtle_traverse(ctx, [ctx.turtle_00, ctx.turtle_w0, ctx.turtle_wh, ctx.turtle_0h, ctx.turtle_00])
 
     def try_do_update(idx):
         """Performs an update if IDX matches up with NO_ANIM_UPDATE_RATE."""
-        if (idx + 1) % NO_ANIM_UPDATE_RATE == 0:
-            turtle.update()
-
-    if intersperse:
-        # Potential problem: largest groups still dominate color space
-        groups = list(svgroot)
-        END_ORIENTED = True
-        for _j, (path, _i) in enumerate(intersperse_elements([list(g) for g in svgroot], END_ORIENTED)):
-            if not color_group(groups[_i]):
-                continue
-            handle_path(path)
-            if direct_draw and not animation:
+        if (idx + 1) % config.NO_ANIM_UPDATE_RATE == 0:
+            ctx.turtle.update()
+
+    sketched = config.NO_ANIM_SKETCH is not None and isinstance(ctx.renderer, CanvasRenderer)
+    if sketched:
+        sketch_drawing(ctx, scheduler)
+
+    _i, num_paths, num_points = None, 0, 0
+    for _j, (group_idx, color, pts, offsets) in enumerate(open_drawing(ctx)):
+        if color is not None:
+            turtle_color(ctx, color)
+        if pts is not None:
+            draw_path(ctx, pts, offsets)
+            num_paths += 1
+            num_points += len(pts)
+        if ctx.direct_draw and not config.animation:
+            if scheduler is not None:
+                scheduler.tick()
+            elif config.intersperse or config.NO_ANIM_UPDATE != 'group':
                 try_do_update(_j)
+            elif group_idx != _i:
+                if _i is not None:
+                    try_do_update(_i)
+                _i = group_idx
+    if sketched:
+        ctx.renderer.clear(CanvasRenderer.SKETCH_TAG)
+
+    print_stats(ctx)
+    turtle_hide(ctx)
+    if ctx.direct_draw:
+        if not config.animation:
+            ctx.turtle.update()
+        if scheduler is not None:
+            scheduler.report(ctx.infile)
+    elif ctx.backend == 'raster':
+        ctx.renderer.save(ctx.outfile)
     else:
-        for _i, g in enumerate(svgroot):
-            if not color_group(g):
-                continue
-            for _j, path in enumerate(g):
-                handle_path(path)
-                if direct_draw and not animation and NO_ANIM_UPDATE != 'group':
-                    try_do_update(_j)
-            if direct_draw and not animation and NO_ANIM_UPDATE == 'group':
-                try_do_update(_i)
-
-    turtle_hide()
-    if direct_draw:
-        if not animation:
-            turtle.update()
-        print('[+] Drawing complete.')
-        if save_output:
-            # Source for following code: https://stackoverflow.com/a/25051183
-            if python_ver >= 3:
-                import tempfile
-                tmpdir = tempfile.mkdtemp()
-                svgfile = os.path.join(tmpdir, 'tmp.svg')
-            else:
-                svgfile = outfile
-            import canvasvg
-            ts = turtle.getscreen().getcanvas()
-            canvasvg.saveall(svgfile, ts)
-            if python_ver >= 3:
-                import cairosvg
-                with open(svgfile) as svg_input, open(outfile, 'wb') as png_output:
-                    cairosvg.svg2png(bytestring=svg_input.read(), write_to=png_output)
-                import shutil
-                shutil.rmtree(tmpdir)
-            print('[+] Output saved to %s.' % outfile)
-        turtle.exitonclick()
+        ctx.scheme_out.close()
+    return num_paths, num_points
+
+def save_canvas(ctx):
+    """Saves the contents of the turtle canvas to CTX.OUTFILE (as a PNG if possible, otherwise as an SVG)."""
+    # Source for following code: https://stackoverflow.com/a/25051183
+    if sys.version_info[0] >= 3:
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        svgfile = os.path.join(tmpdir, 'tmp.svg')
     else:
-        print('[+] Wrote result to %s.' % outfile)
+        svgfile = ctx.outfile
+    import canvasvg
+    ts = ctx.turtle.getscreen().getcanvas()
+    canvasvg.saveall(svgfile, ts)
+    if sys.version_info[0] >= 3:
+        import cairosvg
+        with open(svgfile) as svg_input, open(ctx.outfile, 'wb') as png_output:
+            cairosvg.svg2png(bytestring=svg_input.read(), write_to=png_output)
+        import shutil
+        shutil.rmtree(tmpdir)
+    print('[+] Output saved to %s.' % ctx.outfile)
+
+def wait_for_click(screen):
+    """Blocks until the turtle window SCREEN is clicked."""
+    clicked = []
+    screen.onclick(lambda x, y: clicked.append((x, y)))
+    while not clicked:
+        screen.getcanvas().update()
+        time.sleep(0.05)
+    screen.onclick(None)
+
+#########
+# BATCH #
+#########
+
+def convert_file(infile, backend='scheme', config=None):
+    """Converts INFILE to Scheme code, a PNG or a drawing file, according to BACKEND (meant to be run in a worker process),
+    with the parameters in CONFIG.
+    Returns an (infile, outfile, seconds, number of paths, number of points, error message) tuple.
+    """
+    start = time.time()
+    config = Config() if config is None else config
+    try:
+        ctx = Context(infile, backend, *window_size(config), config=config)
+        num_paths, num_points = draw(ctx)
+        return infile, ctx.outfile, time.time() - start, num_paths, num_points, None
+    except Exception as e:
+        return infile, None, time.time() - start, 0, 0, '%s: %s' % (type(e).__name__, e)
+
+def set_params(params):
+    """Sets the parameters (module-level variables) named in the dict PARAMS, in this process.
+    Conversions read their parameters from a Config, not from these; the command line sets them only so that
+    every Config created afterwards (see CONFIG) starts out from the parameters it was given.
+    """
+    globals().update(params)
+
+def convert_batch(infiles, backend='scheme', jobs=None, config=None):
+    """Converts every file in INFILES using BACKEND ('scheme', 'raster' or 'drawing'), spread across a pool of JOBS processes
+    (by default, one per CPU), and prints a summary once all of them are done.
+    CONFIG goes along with every file, so every process
+    converts with the same parameters, however the workers are started.
+    Returns the number of files which could not be converted.
+    """
+    import multiprocessing
+    config = Config() if config is None else config
+    jobs = min(jobs or multiprocessing.cpu_count(), len(infiles))
+    start = time.time()
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap_unordered(functools.partial(convert_file, backend=backend, config=config), infiles)
+    else:
+        pool, results = None, (convert_file(infile, backend, config) for infile in infiles)
+
+    total_time, total_paths, total_points, failures = 0.0, 0, 0, 0
+    for infile, outfile, seconds, num_paths, num_points, error in results:
+        total_time += seconds
+        if error is not None:
+            failures += 1
+            print('[-] Failed to convert %s (%s).' % (infile, error))
+            continue
+        total_paths += num_paths
+        total_points += num_points
+        print('[+] Wrote result to %s. (%.2fs, %d paths, %d points)' % (outfile, seconds, num_paths, num_points))
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if len(infiles) > 1:
+        elapsed = time.time() - start
+        print('---')
+        print('[+] Converted %d/%d files with %d process(es): %d paths, %d points.'
+              % (len(infiles) - failures, len(infiles), jobs, total_paths, total_points))
+        print('[+] Wall time %.2fs, total conversion time %.2fs (%.1fx).'
+              % (elapsed, total_time, total_time / elapsed if elapsed > 0 else 1.0))
+    return failures
+
+###########
+# LIBRARY #
+###########
+
+import ast
+
+# Every parameter at the top of this file (plus OUTFOLDER), as the attributes of a Config
+PARAMETERS = ('fill_shapes', 'draw_boundary', 'step_size', 'flatten_tolerance', 'bezier_option', 'cubic_unfinished',
+              'standard_paths', 'animation', 'clip', 'intersperse', 'color_batch', 'simplify_tolerance', 'reorder_paths',
+              'reverse_paths', 'zoom', 'lod_pixels', 'lod_drop', 'pen_width', 'save_output', 'bulk_canvas',
+              'DEFAULT_WINDOW_WIDTH', 'DEFAULT_WINDOW_HEIGHT', 'WINDOW_WIDTH_OVERRIDE', 'WINDOW_HEIGHT_OVERRIDE',
+              'NO_ANIM_UPDATE', 'NO_ANIM_UPDATE_RATE', 'NO_ANIM_FPS', 'NO_ANIM_SKETCH', 'CACHE_DIR', 'CACHE_MAX_BYTES',
+              'SCHEME_FLUSH_SIZE', 'SCHEME_PRECISION', 'SCHEME_COMPACT', 'SCHEME_LIST_SIZE', 'OUTFOLDER')
+
+def parse_params(text):
+    """Returns the parameter assignments in TEXT (`name = value` lines, as at the top of this file) as a dict.
+    Values must be Python literals. Raises SyntaxError or ValueError for anything else.
+    """
+    params = {}
+    for node in ast.parse(text).body:
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)):
+            raise ValueError('expected `name = value` (line %d)' % node.lineno)
+        params[node.targets[0].id] = ast.literal_eval(node.value)
+    return params
+
+class Config(object):
+    """A full set of parameters to convert with, as attributes named after the parameters at the top of this file
+    (see PARAMETERS). Those that are not given take the module-level values at the time the Config is created,
+    e.g. Config(step_size=0.25, intersperse=False). FROM_FILE reads them from `name = value` lines instead
+    (see PARSE_PARAMS), and REPLACE returns a copy with some of them changed.
+    Raises TypeError for parameters that do not exist, and ValueError for a REORDER_PATHS not in REORDER_OPTIONS.
+    The entry points that take a CONFIG (CONTEXT, CONVERT_FILE, CONVERT_BATCH, CONVERT and WATCH) use Config() if it is left out.
+    """
+
+    def __init__(self, **params):
+        unknown = sorted(name for name in params if name not in PARAMETERS)
+        if unknown:
+            raise TypeError('unknown parameter(s): %s' % ', '.join(unknown))
+        for name in PARAMETERS:
+            setattr(self, name, params.get(name, globals()[name]))
+        if self.reorder_paths not in REORDER_OPTIONS:
+            raise ValueError('reorder_paths must be one of %s (not %r)'
+                             % (', '.join(repr(option) for option in REORDER_OPTIONS), self.reorder_paths))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(**parse_params(f.read()))
+
+    def params(self):
+        """Returns the parameters as a dict (see SET_PARAMS)."""
+        return dict((name, getattr(self, name)) for name in PARAMETERS)
+
+    def replace(self, **params):
+        merged = self.params()
+        merged.update(params)
+        return Config(**merged)
+
+def convert(path, config=None, backend='scheme'):
+    """Converts the SVG (or drawing) file at PATH to Scheme code, a PNG or a drawing file, according to BACKEND,
+    with the parameters in CONFIG. Returns the path of the output file.
+    Unlike CONVERT_FILE, errors are raised rather than returned.
+
+    Every stage reads its parameters from CONFIG (as CTX.CONFIG) rather than from the module-level variables,
+    which are left alone, so conversions with different configs can run at the same time in different threads
+    (sharing the path cache, but not an output file).
+    """
+    if backend not in BACKENDS or backend == 'turtle':
+        raise ValueError('cannot convert with the %r backend' % backend)
+    config = Config() if config is None else config
+    ensure_dir(config.OUTFOLDER)
+    ctx = Context(path, backend, *window_size(config), config=config)
+    draw(ctx)
+    return ctx.outfile
+
+##############
+# WATCH MODE #
+##############
+
+WATCH_INTERVAL = 0.25  # seconds between checks for changes
+
+# The stages of a render, in order, along with the parameters that each of them depends on.
+# When a parameter changes, its stage and all of the stages after it have to be run again.
+WATCH_STAGES = (
+    ('parse', ('standard_paths', 'bezier_option')),
+    ('flatten', ('step_size', 'flatten_tolerance', 'cubic_unfinished', 'clip', 'zoom', 'lod_pixels', 'lod_drop',
+                 'DEFAULT_WINDOW_WIDTH', 'DEFAULT_WINDOW_HEIGHT', 'WINDOW_WIDTH_OVERRIDE', 'WINDOW_HEIGHT_OVERRIDE')),
+    ('simplify', ('simplify_tolerance',)),
+    ('order', ('intersperse', 'color_batch', 'reorder_paths', 'reverse_paths')),
+    ('draw', ('fill_shapes', 'draw_boundary', 'pen_width', 'animation', 'bulk_canvas', 'NO_ANIM_UPDATE',
+              'NO_ANIM_UPDATE_RATE', 'NO_ANIM_FPS', 'NO_ANIM_SKETCH', 'SCHEME_FLUSH_SIZE', 'SCHEME_PRECISION',
+              'SCHEME_COMPACT', 'SCHEME_LIST_SIZE')),
+)
+STAGE_NAMES = [name for name, _ in WATCH_STAGES]
+MEMO_STAGES = ('parse', 'flatten', 'simplify')  # the stages that are run path by path
+
+class PathMemo(object):
+    """Remembers the result of a stage for every path, keyed by its path description (`d` attribute).
+    LOOKUP returns the result for D, calling COMPUTE(D) only if there is none yet (and counting it in MISSES).
+    SWEEP(LIVE), called after each render, forgets the results for paths which are not in the set LIVE
+    (such as those that were edited out of the file) and starts counting afresh.
+    """
+
+    def __init__(self):
+        self.results, self.used, self.misses = {}, set(), 0
+
+    def lookup(self, d, compute):
+        self.used.add(d)
+        result = self.results.get(d)
+        if result is None:
+            result = self.results[d] = compute(d)
+            self.misses += 1
+        return result
+
+    def sweep(self, live):
+        self.results = dict((d, result) for d, result in self.results.items() if d in live)
+        self.used, self.misses = set(), 0
+
+    def clear(self):
+        self.results = {}
+
+def apply_params(config, params):
+    """Applies the parameters in PARAMS (a dict, as returned by PARSE_PARAMS) that are listed in WATCH_STAGES
+    and whose values have changed to the Config CONFIG. Returns (the new Config, the index of the earliest stage
+    which they invalidate), or (CONFIG, None) if nothing changed. Raises ValueError for values that CONFIG does not allow.
+    """
+    stages = dict((name, i) for i, (_, names) in enumerate(WATCH_STAGES) for name in names)
+    changed = {}
+    for name, value in sorted(params.items()):
+        if name not in stages:
+            print('[-] Ignoring %s (not a parameter that can be changed while watching).' % name)
+        elif getattr(config, name) != value:
+            changed[name] = value
+    if not changed:
+        return config, None
+    config = config.replace(**changed)
+    print('[+] Set %s.' % ', '.join('%s = %r' % item for item in sorted(changed.items())))
+    return config, min(stages[name] for name in changed)
+
+class DrawingSession(object):
+    """Keeps the compiled drawing of the SVG file INFILE in memory between renders (see CONTEXT for BACKEND and TURTLE),
+    so that after a change, only the stages of WATCH_STAGES that it invalidates are run again.
+
+    The results of the path-by-path stages are kept in MEMOS (a PATHMEMO per stage), and the drawing's records
+    (see ITER_DRAWING) in RECORDS. INVALIDATE(STAGE) forgets the results of STAGE and every stage after it.
+    If the file itself changes, the drawing is put together again from the new file, but as the memos
+    are keyed by path data, only the paths (and therefore groups) that are new or were edited are recompiled.
+    The flattened paths are in turtle coordinates, though, so if the coordinate transform or the canvas bounds change
+    (say, because the viewBox was edited), every path is flattened again (see TRANSFORM).
+    """
+
+    def __init__(self, infile, backend, turtle=None):
+        self.infile, self.backend, self.turtle = infile, backend, turtle
+        self.memos = dict((stage, PathMemo()) for stage in MEMO_STAGES)
+        self.records, self.ctx = None, None
+        self.mtime = os.path.getmtime(infile)
+
+    def file_changed(self):
+        """True if INFILE has been modified since the last call."""
+        mtime = os.path.getmtime(self.infile)
+        changed, self.mtime = mtime != self.mtime, mtime
+        return changed
+
+    def invalidate(self, stage):
+        for name in STAGE_NAMES[stage:]:
+            if name in self.memos:
+                self.memos[name].clear()
+        if stage <= STAGE_NAMES.index('order'):
+            self.records = None
+
+    @staticmethod
+    def transform(ctx):
+        """Returns what the flattened paths of CTX depend on besides their path data and the parameters:
+        the mapping from SVG to turtle coordinates and the BOUNDS they are clipped to.
+        """
+        return ctx.x_scale, ctx.y_scale, ctx.x_shift, ctx.y_shift, ctx.canvas_height, ctx.bounds
+
+    def render(self, config):
+        """Draws the drawing (or writes its output file) with the parameters in CONFIG (a Config),
+        running only the stages that have been invalidated.
+        """
+        start = time.time()
+        screen = None
+        if self.turtle is not None:
+            screen = self.turtle.getscreen()
+            self.turtle.reset()
+            if self.ctx is not None and self.ctx.renderer is not None:
+                self.ctx.renderer.clear()
+        previous = self.ctx
+        ctx = self.ctx = Context(self.infile, self.backend, *window_size(config, screen), turtle=self.turtle, config=config)
+        if previous is not None and self.transform(previous) != self.transform(ctx):
+            self.invalidate(STAGE_NAMES.index('flatten'))
+        if self.records is None:
+            ctx.memos = self.memos
+            self.records = list(iter_drawing(ctx))
+            work = ', '.join('%s %d' % (stage, self.memos[stage].misses) for stage in MEMO_STAGES)
+            # A path's earlier stages go unused while its later ones are remembered, so they are kept for as long as any is
+            live = set().union(*[memo.used for memo in self.memos.values()])
+            for memo in self.memos.values():
+                memo.sweep(live)
+        else:
+            work = 'none, redrawn only'
+        ctx.records = self.records
+        num_paths, num_points = draw(ctx)
+        print('[+] Rendered %s in %.2fs (%d paths, %d points; paths recompiled by stage: %s).'
+              % (self.infile, time.time() - start, num_paths, num_points, work))
+
+def read_lines(stream, lines):
+    """Puts every line read from STREAM into the queue LINES, until the end of the stream."""
+    for line in iter(stream.readline, ''):
+        lines.put(line)
+
+def watch(infiles, backend, config=None, config_file=None, turtle=None):
+    """Renders each of the SVG files INFILES with a DRAWINGSESSION, then keeps rendering them again as things change,
+    until interrupted (Ctrl-C). The parameters start out as CONFIG.
+    Changes are parameter assignments (see PARSE_PARAMS) typed into standard input or saved to the file CONFIG_FILE
+    (which is read in full whenever it is modified), and edits to the input files.
+    """
+    import threading
+    try:
+        import queue
+    except ImportError:
+        import Queue as queue  # Python 2
+
+    config = Config() if config is None else config
+    sessions = [DrawingSession(infile, backend, turtle) for infile in infiles]
+    config_mtime = None
+    if config_file is not None:
+        config_mtime = os.path.getmtime(config_file)
+        with open(config_file) as f:
+            config, _ = apply_params(config, parse_params(f.read()))
+    for session in sessions:
+        session.render(config)
+
+    lines = queue.Queue()
+    reader = threading.Thread(target=read_lines, args=(sys.stdin, lines))
+    reader.daemon = True
+    reader.start()
+    print('[+] Watching for changes. Enter `name = value` to change a parameter%s, or press Ctrl-C to stop.'
+          % ('' if config_file is None else ' (or edit %s)' % config_file))
+    try:
+        while True:
+            changes = []
+            if config_file is not None and os.path.getmtime(config_file) != config_mtime:
+                config_mtime = os.path.getmtime(config_file)
+                with open(config_file) as f:
+                    changes.append(f.read())
+            while not lines.empty():
+                changes.append(lines.get())
+            stage = None
+            for text in changes:
+                try:
+                    config, changed = apply_params(config, parse_params(text))
+                except (SyntaxError, ValueError) as e:
+                    print('[-] Could not read %r (%s).' % (text.strip(), e))
+                    continue
+                if changed is not None:
+                    stage = changed if stage is None else min(stage, changed)
+            for session in sessions:
+                session_stage = stage
+                if session.file_changed():
+                    print('[+] %s has changed.' % session.infile)
+                    session_stage = min(STAGE_NAMES.index('order'), len(STAGE_NAMES) if stage is None else stage)
+                if session_stage is None:
+                    continue
+                session.invalidate(session_stage)
+                try:
+                    session.render(config)
+                except Exception as e:
+                    print('[-] Failed to render %s (%s: %s).' % (session.infile, type(e).__name__, e))
+            if turtle is not None:
+                turtle.getscreen().getcanvas().update()
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        print('[+] Stopped watching.')
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    backend_group = parser.add_mutually_exclusive_group()
+    backend_group.add_argument('--scheme', '-s', action='store_true', help='convert to Scheme turtle code')
+    backend_group.add_argument('--raster', '-r', action='store_true', help='render PNGs without opening a window')
+    backend_group.add_argument('--drawing', '-d', action='store_true',
+                               help='save the compiled paths as %s drawing files, which any backend can then draw' % DRAWING_EXT)
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='number of processes to convert with (default: one per CPU; not in turtle mode)')
+    parser.add_argument('--zoom', '-z', type=float, nargs=4, metavar=('X', 'Y', 'W', 'H'), default=None,
+                        help='draw only this rectangle of the SVG viewBox (sets ZOOM)')
+    parser.add_argument('--config', '-c', type=str, default=None,
+                        help='file of `name = value` lines overriding the parameters at the top of this file')
+    parser.add_argument('--watch', '-w', action='store_true',
+                        help='keep running, and draw again whenever parameters (typed in, or in --config) or the input change')
+    parser.add_argument('input_files', type=str, nargs='+', help='___.svg or ___%s' % DRAWING_EXT)
+    args = parser.parse_args()
+
+    params = {}
+    if args.config is not None:
+        with open(args.config) as f:
+            params.update(parse_params(f.read()))
+    if args.zoom is not None:
+        params['zoom'] = tuple(args.zoom)
+    try:
+        config = Config(**params)
+    except (TypeError, ValueError) as e:
+        parser.error(str(e) if args.config is None else '%s (in %s)' % (e, args.config))
+    set_params(config.params())  # so that any Config made from here on starts out from these too
+    if args.watch and any(is_drawing_file(infile) for infile in args.input_files):
+        parser.error('--watch only works with SVG files')
+    if args.watch and not (args.scheme or args.raster or args.drawing) and len(args.input_files) > 1:
+        parser.error('--watch draws a single file at a time in turtle mode')
+
+    if not os.path.isdir(config.OUTFOLDER):
+        os.makedirs(config.OUTFOLDER)
+
+    if args.scheme or args.raster or args.drawing:
+        backend = 'scheme' if args.scheme else 'raster' if args.raster else 'drawing'
+        if args.watch:
+            watch(args.input_files, backend, config, args.config)
+            sys.exit(0)
+        failures = convert_batch(args.input_files, backend, args.jobs, config)
+        sys.exit(1 if failures else 0)
+
+    import turtle
+    import tkinter
+    turtle.title('Turtledraw')
+    turtle.mode('logo')
+    screen = turtle.getscreen()
+    if args.watch:
+        watch(args.input_files, 'turtle', config, args.config, turtle)
+        sys.exit(0)
+    for _k, infile in enumerate(args.input_files):
+        if _k > 0:
+            wait_for_click(screen)
+            turtle.reset()
+            if ctx.renderer is not None:
+                ctx.renderer.clear()
+        ctx = Context(infile, 'turtle', *window_size(config, screen), turtle=turtle, config=config)
+        draw(ctx)
+        print('[+] Drawing complete.')
+        if config.save_output:
+            save_canvas(ctx)
+    turtle.exitonclick()